@@ -0,0 +1,148 @@
+# coding=utf-8
+# Moves deadlines whose dates have all passed out of the live tables and into
+# deadlines_archive_perform, so the lookups, listings and item index only
+# ever see live conferences, and answers questions about past years from the
+# archive. compact() runs nightly on the digest thread.
+import datetime
+import logging
+import os
+
+from sqlalchemy import and_, or_, select
+
+import db
+import metrics
+import wikicfp_index
+from db import ArchivedDeadline, Deadline, ResponseDeadline
+
+logger = logging.getLogger(__name__)
+
+# Days a deadline stays in the live tables after its last date has passed
+ARCHIVE_AFTER_DAYS = int(os.environ.get('ARCHIVE_AFTER_DAYS', '90'))
+# Until its final notification date is known, a deadline's last date is
+# taken to be this many days after it, so the notification dates can still
+# be added once the submission is in
+NOTIFICATION_WAIT_DAYS = 180
+# Deadlines moved per transaction
+BATCH_SIZE = 500
+# Rows an archive search replies with
+SEARCH_LIMIT = 20
+
+DATE_FORMAT = "%b %d, %Y"
+
+
+def _archivable(cutoff, limit):
+    # Deadlines whose dates are all before `cutoff`, joined to their response
+    # dates. Without a final notification date, the deadline must also be
+    # NOTIFICATION_WAIT_DAYS before it.
+    deadlines = Deadline.__table__
+    responses = ResponseDeadline.__table__
+    unnotified_cutoff = cutoff - datetime.timedelta(days=NOTIFICATION_WAIT_DAYS)
+    return select([
+        deadlines.c.id, deadlines.c.item, deadlines.c.date, deadlines.c.abstract_date,
+        deadlines.c.old_date, responses.c.id.label('response_id'),
+        responses.c.early_response_date, responses.c.notification_date,
+    ]).select_from(
+        deadlines.outerjoin(responses, responses.c.deadline_id == deadlines.c.id)
+    ).where(and_(
+        deadlines.c.date < cutoff,
+        or_(responses.c.early_response_date == None, responses.c.early_response_date < cutoff),
+        or_(responses.c.notification_date < cutoff,
+            and_(responses.c.notification_date == None, deadlines.c.date < unnotified_cutoff)),
+    )).order_by(deadlines.c.id).limit(limit)
+
+
+def _compact_batch(cutoff, now):
+    # Move up to BATCH_SIZE deadlines in one transaction: a select, an
+    # executemany insert and two deletes. Returns how many were moved.
+    session = db.Session()
+    try:
+        rows = session.execute(_archivable(cutoff, BATCH_SIZE)).fetchall()
+        archived, deadline_ids, response_ids = [], [], []
+        for row in rows:
+            if row.response_id is not None:
+                response_ids.append(row.response_id)
+            if deadline_ids and deadline_ids[-1] == row.id:
+                continue  # a second response row for the same deadline
+            series_key, year = wikicfp_index.split_name(row.item)
+            archived.append({
+                'item': row.item, 'lookup_key': db.normalize_item(row.item),
+                'series_key': series_key, 'year': year, 'date': row.date,
+                'abstract_date': row.abstract_date, 'old_date': row.old_date,
+                'early_response_date': row.early_response_date,
+                'notification_date': row.notification_date, 'archived_at': now})
+            deadline_ids.append(row.id)
+        if not archived:
+            return 0
+        session.execute(ArchivedDeadline.__table__.insert(), archived)
+        if response_ids:
+            session.execute(ResponseDeadline.__table__.delete().where(
+                ResponseDeadline.__table__.c.id.in_(response_ids)))
+        session.execute(Deadline.__table__.delete().where(Deadline.__table__.c.id.in_(deadline_ids)))
+        session.commit()
+        return len(archived)
+    except:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+def compact(today=None):
+    # Archive every deadline whose dates all passed more than
+    # ARCHIVE_AFTER_DAYS ago (see _archivable), a batch at a time. Bumps the data version if
+    # any were moved. Returns how many.
+    today = today or datetime.date.today()
+    cutoff = today - datetime.timedelta(days=ARCHIVE_AFTER_DAYS)
+    now = datetime.datetime.utcnow()
+    moved = 0
+    with metrics.timed('archive_compaction_seconds'):
+        while True:
+            batch = _compact_batch(cutoff, now)
+            moved += batch
+            if batch < BATCH_SIZE:
+                break
+    if moved:
+        metrics.inc('archived_deadlines_total', moved)
+        logger.info('Archived %d past deadlines', moved)
+        db.bump_data_version()
+    return moved
+
+
+@db.retry_read
+def search(session, item, limit=SEARCH_LIMIT):
+    # Archived deadlines whose item starts with `item` once both are
+    # normalized (or matches it as a LIKE pattern), latest first
+    key = db.normalize_item(item)
+    if '%' not in key:
+        key += '%'
+    return (session.query(ArchivedDeadline).filter(ArchivedDeadline.lookup_key.like(key))
+            .order_by(ArchivedDeadline.date.desc()).limit(limit).all())
+
+
+@db.retry_read
+def previous_meeting(session, item):
+    # The archived meeting before `item`: for "CHI 2027", CHI 2026 if it is
+    # archived, otherwise the latest earlier one; for a name without a year,
+    # the latest archived meeting of the series. None if there is none.
+    series_key, year = wikicfp_index.split_name(item)
+    query = session.query(ArchivedDeadline).filter(ArchivedDeadline.series_key == series_key)
+    if year is not None:
+        query = query.filter(or_(ArchivedDeadline.year == None, ArchivedDeadline.year < year))
+        last_year = query.filter(ArchivedDeadline.year == year - 1).order_by(
+            ArchivedDeadline.date.desc()).first()
+        if last_year is not None:
+            return last_year
+    return query.order_by(ArchivedDeadline.date.desc()).first()
+
+
+def describe(archived):
+    # "CHI 2026: deadline Sep 12, 2025 (abstract Sep 05, 2025), final
+    # notification Dec 01, 2025"
+    text = "{}: deadline {}".format(archived.item, archived.date.strftime(DATE_FORMAT))
+    if archived.abstract_date is not None:
+        text += " (abstract {})".format(archived.abstract_date.strftime(DATE_FORMAT))
+    if archived.early_response_date is not None:
+        text += ", early notification {}".format(archived.early_response_date.strftime(DATE_FORMAT))
+    if archived.notification_date is not None:
+        text += ", final notification {}".format(archived.notification_date.strftime(DATE_FORMAT))
+    return text
@@ -0,0 +1,109 @@
+# coding=utf-8
+# Time to import a CSV of N conferences with bulk.import_rows against adding
+# them one "X is on DATE" command at a time (a prefix lookup, an insert and a
+# commit each), into a table that already holds as many other conferences.
+#
+#     python -m bench.bulk_import [--rows 100,1000] [--repeat 5]
+#                                 [--database-url postgresql://...]
+import argparse
+import datetime
+import os
+import shutil
+import tempfile
+import time
+
+from bench import harness
+
+
+def csv_text(count, today):
+    lines = ['Conference,Deadline,Abstract,Notification']
+    for i in range(count):
+        date = today + datetime.timedelta(days=30 + i % 300)
+        lines.append('NEW{:05d} {},{},{},{}'.format(
+            i, date.year, date.strftime('%b %d %Y'), (date - datetime.timedelta(days=7)).strftime('%b %d %Y'),
+            (date + datetime.timedelta(days=60)).strftime('%b %d %Y')))
+    return '\n'.join(lines) + '\n'
+
+
+def reset(db, existing, today):
+    engine = db.get_engine()
+    engine.execute(db.ResponseDeadline.__table__.delete())
+    engine.execute(db.Deadline.__table__.delete())
+    engine.execute(db.Deadline.__table__.insert(), [
+        {'item': 'OLD{:05d}'.format(i), 'lookup_key': 'old{:05d}'.format(i),
+         'date': today + datetime.timedelta(days=i % 365)} for i in range(existing)])
+    db.bump_data_version()
+
+
+def one_by_one(db, deadlines, bulk, text):
+    # What seeding a term looked like before: each row a separate command
+    rows, _ = bulk.parse_csv(text)
+    for row in rows:
+        _, date = deadlines.parse_and_verify_date(row.date)
+        _, abstract_date = deadlines.parse_and_verify_date(row.abstract_date, strict=True)
+        _, notification_date = deadlines.parse_and_verify_date(row.notification_date, strict=True)
+        session = db.Session()
+        try:
+            if not db.find_deadlines(session, row.item):
+                d = db.Deadline(item=row.item, date=date, abstract_date=abstract_date)
+                d.response = db.ResponseDeadline(item=row.item, notification_date=notification_date)
+                session.add(d)
+                session.commit()
+                db.bump_data_version()
+        finally:
+            session.close()
+
+
+def batched(db, deadlines, bulk, text):
+    rows, _ = bulk.parse_csv(text)
+    session = db.Session()
+    try:
+        bulk.import_rows(session, rows, deadlines.parse_and_verify_date)
+        session.commit()
+        db.bump_data_version()
+    finally:
+        session.close()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', default='100,1000')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--database-url',
+                        help='an empty scratch database; defaults to a temporary SQLite file')
+    args = parser.parse_args()
+
+    tmpdir = None
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        tmpdir = tempfile.mkdtemp(prefix='performbot-bench-')
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmpdir, 'bench.db')
+    os.environ['SQL_ECHO'] = '0'
+
+    import bulk
+    import db
+    import deadlines
+    try:
+        db.Base.metadata.create_all(db.get_engine())
+        today = datetime.date.today()
+        print('{:<12} {:>8} {:>10} {:>10}'.format('import', 'rows', 'ms', 'ms/row'))
+        for count in (int(n) for n in args.rows.split(',')):
+            text = csv_text(count, today)
+            for name, run in (('one by one', one_by_one), ('batched', batched)):
+                times = []
+                for _ in range(args.repeat):
+                    reset(db, count, today)
+                    start = time.perf_counter()
+                    run(db, deadlines, bulk, text)
+                    times.append(time.perf_counter() - start)
+                seconds = harness.percentile(times, 50)
+                print('{:<12} {:>8} {:>10.1f} {:>10.3f}'.format(name, count, seconds * 1000,
+                                                               seconds * 1000 / count))
+    finally:
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+# coding=utf-8
+# Compare date parsing throughput of plain dateparser (what
+# parse_and_verify_date used to call) against dates.parse_date.
+#
+#     python -m bench.dates [--repeat N]
+import argparse
+import datetime
+import time
+
+import dateparser
+
+import dates
+
+SAMPLES = [
+    'on May 3', 'by May 3rd', 'on 3 May 2027', 'on 2027-05-03', 'by Sept 4',
+    'on Jan 5, 2027', 'in 3 weeks', 'in 2 days', 'on next Friday',
+    'on tomorrow', 'on 5th of May', 'on 12/01/2027', 'in May',
+]
+
+
+def run(parse, repeat, before_round=None):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        if before_round is not None:
+            before_round()
+        for sample in SAMPLES:
+            parse(sample)
+    elapsed = time.perf_counter() - start
+    return repeat * len(SAMPLES) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    today = datetime.date.today()
+    # Warm up dateparser's lazily loaded language data so neither side pays it
+    dateparser.parse(SAMPLES[0])
+    dates.parse_date(SAMPLES[0], today)
+
+    results = [
+        ('dateparser.parse', run(dateparser.parse, args.repeat)),
+        ('parse_date (cold cache)',
+         run(lambda s: dates.parse_date(s, today), args.repeat,
+             before_round=dates._parse.cache_clear)),
+        ('parse_date (warm cache)',
+         run(lambda s: dates.parse_date(s, today), args.repeat)),
+    ]
+    baseline = results[0][1]
+    for name, rate in results:
+        print('{:<26} {:>12.0f} parses/s {:>8.1f}x'.format(name, rate, rate / baseline))
+
+
+if __name__ == '__main__':
+    main()
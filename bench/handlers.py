@@ -0,0 +1,200 @@
+# coding=utf-8
+# Latency of the deadlines.py command handlers against a seeded database and
+# a local WikiCFP stand-in, reported per handler and per stage.
+#
+#     python -m bench.handlers [--sizes 10,100,1000,10000] [--rounds 30]
+#                              [--wikicfp-latency 0.05] [--cold-wikicfp]
+#                              [--database-url postgresql://...]
+#
+# Without --database-url the database is a throwaway SQLite file. Stage times
+# are totals per command. The listings take their links from the local
+# WikiCFP index, so 'scraping' shows up under the index refresh, which the
+# bot runs in the background after writes.
+import argparse
+import datetime
+import importlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from collections import defaultdict
+
+from bench import harness
+
+DATE_FORMAT = "%b %d, %Y"
+
+
+def item_name(i):
+    return 'CONF{:05d}'.format(i)
+
+
+def deadline_date(i, today):
+    # Spread deadlines over a year either side of today, like a database
+    # that has been in use for a while
+    return today + datetime.timedelta(days=(i * 7919) % 730 - 365)
+
+
+def seed(db, start, stop, today):
+    engine = db.get_engine()
+    deadlines, responses = [], []
+    for i in range(start, stop):
+        date = deadline_date(i, today)
+        deadlines.append({'id': i + 1, 'item': item_name(i), 'lookup_key': item_name(i).lower(),
+                          'date': date,
+                          'abstract_date': date - datetime.timedelta(days=7) if i % 3 == 0 else None})
+        if i % 2 == 0:
+            responses.append({'item': item_name(i), 'lookup_key': item_name(i).lower(),
+                              'deadline_id': i + 1,
+                              'notification_date': date + datetime.timedelta(days=60),
+                              'early_response_date': (date + datetime.timedelta(days=30)
+                                                      if i % 4 == 0 else None)})
+    if deadlines:
+        engine.execute(db.Deadline.__table__.insert(), deadlines)
+    if responses:
+        engine.execute(db.ResponseDeadline.__table__.insert(), responses)
+    db.bump_data_version()
+
+
+def commands(size, round_num, today):
+    # One round of commands against an upcoming seeded deadline (at least two
+    # days out, so an abstract deadline can go before it)
+    candidates = [i for i in range(size) if (deadline_date(i, today) - today).days >= 2]
+    i = candidates[(round_num * 31) % len(candidates)]
+    item = item_name(i)
+    date = deadline_date(i, today)
+    new_item = 'BENCH{:05d}R{:04d}'.format(size, round_num)
+    return [
+        ('set_deadline', '{} is on {}'.format(new_item, date.strftime(DATE_FORMAT))),
+        ('forget_deadline', 'forget about {}'.format(new_item)),
+        ('change_deadline', '{} moved to {}'.format(item, date.strftime(DATE_FORMAT))),
+        ('add_abstract_deadline', 'abstract for {} due on {}'.format(
+            item, (today + datetime.timedelta(days=1)).strftime(DATE_FORMAT))),
+        ('add_notification_date (early)', 'early notification for {} is on {}'.format(
+            item, (date + datetime.timedelta(days=30)).strftime(DATE_FORMAT))),
+        ('add_notification_date (final)', 'notification for {} is on {}'.format(
+            item, (date + datetime.timedelta(days=90)).strftime(DATE_FORMAT))),
+        ('get_notification_date', 'when does {} come back?'.format(item)),
+        ('clear_early_notification_date', 'clear early notification date for {}'.format(item)),
+    ]
+
+
+def instrument(timer, db, dates, wikicfp):
+    from sqlalchemy import event
+
+    engine = db.get_engine()
+    engine.echo = False
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._bench_start = time.perf_counter()
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        timer.add('sql', time.perf_counter() - context._bench_start)
+
+    dates.parse_date = timer.wrap('date parsing', dates.parse_date)
+    wikicfp.search = timer.wrap('scraping', wikicfp.search)
+    json.dumps = timer.wrap('json', json.dumps)
+
+
+def clear_wikicfp_index(db):
+    for table in (db.WikiCFPEvent, db.WikiCFPSeries):
+        db.get_engine().execute(table.__table__.delete())
+
+
+def run_size(size, args, db, digest, wikicfp, wikicfp_index, timer, today):
+    latencies = defaultdict(list)
+    stages = defaultdict(lambda: defaultdict(list))
+
+    def measure_call(name, func, *func_args):
+        timer.reset()
+        start = time.perf_counter()
+        result = func(*func_args)
+        latencies[name].append(time.perf_counter() - start)
+        for stage, seconds in timer.reset().items():
+            stages[name][stage].append(seconds)
+        return result
+
+    def measure(name, text, category='respond_to', before=None):
+        if before is not None:
+            before()
+        start = time.perf_counter()
+        message = measure_call(name, harness.dispatch, text, category)
+        # Listings go out in several messages; the first has the most
+        # urgent dates
+        if len(message.webapi_times) > 1:
+            latencies[name + ' first message'].append(message.webapi_times[0] - start)
+        return message
+
+    def rebuild_listings():
+        db.bump_data_version()
+        if args.cold_wikicfp:
+            clear_wikicfp_index(db)
+
+    for round_num in range(args.rounds):
+        for name, text in commands(size, round_num, today):
+            measure(name, text)
+        measure_call('wikicfp index refresh', wikicfp_index.refresh, today)
+        measure('list_deadlines (rebuild)', 'deadlines', 'listen_to', before=rebuild_listings)
+        measure('list_deadlines (cached)', 'deadlines', 'listen_to')
+        measure('list_notification_dates (rebuild)', 'notification dates', 'listen_to',
+                before=rebuild_listings)
+        measure('list_notification_dates (cached)', 'notification dates', 'listen_to')
+
+    print()
+    print(harness.percentile_header('{} deadlines'.format(size)))
+    for name in latencies:
+        print(harness.format_percentiles(name, latencies[name]))
+        for stage in sorted(stages[name]):
+            print(harness.format_percentiles(stage, stages[name][stage], indent='    '))
+    print('listing cache: {}'.format(', '.join(
+        '{} {}'.format(key, value) for key, value in sorted(digest.cache_stats().items()))))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', default='10,100,1000,10000')
+    parser.add_argument('--rounds', type=int, default=30)
+    parser.add_argument('--wikicfp-latency', type=float, default=0.05,
+                        help='seconds the WikiCFP stand-in waits before each response')
+    parser.add_argument('--cold-wikicfp', action='store_true',
+                        help='empty the WikiCFP index before every listing rebuild')
+    parser.add_argument('--database-url',
+                        help='an empty scratch database; defaults to a temporary SQLite file')
+    args = parser.parse_args()
+    sizes = sorted(int(size) for size in args.sizes.split(','))
+
+    tmpdir = None
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        tmpdir = tempfile.mkdtemp(prefix='performbot-bench-')
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmpdir, 'bench.db')
+
+    import dates
+    import db
+    importlib.import_module('deadlines')  # registers the handlers
+    import digest
+    import wikicfp
+    import wikicfp_index
+
+    timer = harness.StageTimer()
+    try:
+        with harness.WikiCFPStub(args.wikicfp_latency) as stub:
+            wikicfp.WIKICFP_URL = stub.url
+            instrument(timer, db, dates, wikicfp)
+            db.Base.metadata.create_all(db.get_engine())
+            today = datetime.date.today()
+            seeded = 0
+            for size in sizes:
+                seed(db, seeded, size, today)
+                seeded = size
+                run_size(size, args, db, digest, wikicfp, wikicfp_index, timer, today)
+    finally:
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
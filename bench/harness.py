@@ -0,0 +1,154 @@
+# coding=utf-8
+# Shared pieces for the benchmarks: a fake slackbot message, a local stand-in
+# for WikiCFP, per-stage timers and percentile reporting.
+import os
+import threading
+import time
+import zlib
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlparse
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES, name), encoding='utf-8') as f:
+        return f.read()
+
+
+class FakeMessage(object):
+    # Enough of slackbot.dispatcher.Message for the plugins; everything the
+    # bot would have said is kept in `replies` and `webapi_calls`, and when
+    # each web API message went out in `webapi_times`
+    def __init__(self, text, channel='CBENCH', user='UBENCH'):
+        self.body = {'text': text, 'channel': channel, 'user': user}
+        self.replies = []
+        self.webapi_calls = []
+        self.webapi_times = []
+
+    def reply(self, text, in_thread=None):
+        self.replies.append(text)
+
+    def send(self, text, thread_ts=None):
+        self.replies.append(text)
+
+    def send_webapi(self, text, attachments=None, as_user=True, thread_ts=None):
+        self.webapi_calls.append((text, attachments))
+        self.webapi_times.append(time.perf_counter())
+
+
+def dispatch(text, category='respond_to'):
+    # Run `text` through the registered plugins the way slackbot's dispatcher
+    # does and wait for the commands they queued on the worker pool,
+    # returning the message so the caller can inspect the replies
+    from slackbot.manager import PluginsManager
+    import workers
+    message = FakeMessage(text)
+    for func, args in PluginsManager().get_plugins(category, text):
+        if func:
+            func(message, *args)
+    workers.pool.wait_idle()
+    return message
+
+
+class _WikiCFPHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        time.sleep(self.server.latency)
+        url = urlparse(self.path)
+        params = parse_qs(url.query)
+        if url.path.endswith('tool.search'):
+            name = params.get('q', [''])[0]
+            page = self.server.search_page
+        else:
+            self.send_error(404)
+            return
+        # Every search finds the conference it was asked about, alongside
+        # the unrelated entries recorded in the fixture
+        body = (page.replace('{query}', name).replace('{name}', name)
+                .replace('{slug}', name.lower().replace(' ', ''))
+                .replace('{eventid}', str(zlib.crc32(name.encode('utf-8')))))
+        body = body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=UTF-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class WikiCFPStub(object):
+    # Serves the recorded search page on localhost, delaying each
+    # response by `latency` seconds
+    def __init__(self, latency=0.0):
+        self.server = HTTPServer(('127.0.0.1', 0), _WikiCFPHandler)
+        self.server.latency = latency
+        self.server.search_page = read_fixture('wikicfp_search.html')
+        self.url = 'http://127.0.0.1:{}'.format(self.server.server_port)
+        self._thread = threading.Thread(target=self.server.serve_forever)
+        self._thread.daemon = True
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class StageTimer(object):
+    # Accumulates time spent in named stages between calls to reset(); safe
+    # to use from the WikiCFP worker threads
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._totals = defaultdict(float)
+
+    def add(self, stage, seconds):
+        with self._lock:
+            self._totals[stage] += seconds
+
+    @contextmanager
+    def timing(self, stage):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(stage, time.perf_counter() - start)
+
+    def wrap(self, stage, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.timing(stage):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def reset(self):
+        with self._lock:
+            totals = dict(self._totals)
+            self._totals.clear()
+        return totals
+
+
+def percentile(samples, pct):
+    # Nearest-rank percentile of an unsorted list
+    ordered = sorted(samples)
+    if not ordered:
+        return float('nan')
+    rank = max(0, int(round(pct / 100.0 * len(ordered) + 0.5)) - 1)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def format_percentiles(name, samples, indent=''):
+    return '{}{:<34} {:>6} {:>10.2f} {:>10.2f} {:>10.2f}'.format(
+        indent, name, len(samples), percentile(samples, 50) * 1000,
+        percentile(samples, 95) * 1000, percentile(samples, 99) * 1000)
+
+
+def percentile_header(title):
+    return '{:<34} {:>6} {:>10} {:>10} {:>10}'.format(
+        title, 'n', 'p50 ms', 'p95 ms', 'p99 ms')
@@ -0,0 +1,108 @@
+# coding=utf-8
+# Time and memory per row of reading the listings' rows as ORM instances
+# against the Core records db.upcoming_deadlines/upcoming_responses return,
+# with SQL logging off for both.
+#
+#     python -m bench.listing_rows [--rows 1000,10000] [--repeat 10]
+#                                  [--database-url postgresql://...]
+import argparse
+import datetime
+import os
+import shutil
+import tempfile
+import time
+import tracemalloc
+
+from bench import harness
+
+
+def seed(db, count, today):
+    deadlines, responses = [], []
+    for i in range(count):
+        date = today + datetime.timedelta(days=i % 365)
+        item = 'CONF{:05d}'.format(i)
+        deadlines.append({'id': i + 1, 'item': item, 'lookup_key': item.lower(), 'date': date,
+                          'abstract_date': date - datetime.timedelta(days=7)})
+        responses.append({'id': i + 1, 'item': item, 'lookup_key': item.lower(), 'deadline_id': i + 1,
+                          'early_response_date': date + datetime.timedelta(days=30),
+                          'notification_date': date + datetime.timedelta(days=60)})
+    engine = db.get_engine()
+    engine.execute(db.Deadline.__table__.delete())
+    engine.execute(db.ResponseDeadline.__table__.delete())
+    engine.execute(db.Deadline.__table__.insert(), deadlines)
+    engine.execute(db.ResponseDeadline.__table__.insert(), responses)
+
+
+def orm_deadlines(db, session, today):
+    # How upcoming_deadlines read rows before it returned records
+    return (session.query(db.Deadline).filter(db.Deadline.date >= today)
+            .order_by(db.Deadline.date).all())
+
+
+def orm_responses(db, session, today):
+    from sqlalchemy import func, or_
+    r = db.ResponseDeadline
+    return (session.query(r).filter(or_(r.notification_date >= today, r.early_response_date >= today))
+            .order_by(func.coalesce(r.notification_date, r.early_response_date)).all())
+
+
+def measure(db, read, today, repeat):
+    times = []
+    for _ in range(repeat):
+        session = db.Session()
+        start = time.perf_counter()
+        rows = read(session, today)
+        # Touch the fields the listings use
+        for row in rows:
+            row.item
+        times.append(time.perf_counter() - start)
+        session.close()
+    session = db.Session()
+    tracemalloc.start()
+    rows = read(session, today)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    session.close()
+    return len(rows), harness.percentile(times, 50), peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--rows', default='1000,10000')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--database-url',
+                        help='an empty scratch database; defaults to a temporary SQLite file')
+    args = parser.parse_args()
+
+    tmpdir = None
+    if args.database_url:
+        os.environ['DATABASE_URL'] = args.database_url
+    else:
+        tmpdir = tempfile.mkdtemp(prefix='performbot-bench-')
+        os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(tmpdir, 'bench.db')
+    os.environ['SQL_ECHO'] = '0'
+
+    import db
+    try:
+        db.Base.metadata.create_all(db.get_engine())
+        today = datetime.date.today()
+        readers = [
+            ('deadlines, ORM', lambda session, today: orm_deadlines(db, session, today)),
+            ('deadlines, records', db.upcoming_deadlines),
+            ('responses, ORM', lambda session, today: orm_responses(db, session, today)),
+            ('responses, records', db.upcoming_responses),
+        ]
+        print('{:<20} {:>8} {:>10} {:>12} {:>14}'.format('read', 'rows', 'ms', 'us/row', 'peak B/row'))
+        for count in (int(n) for n in args.rows.split(',')):
+            seed(db, count, today)
+            for name, read in readers:
+                rows, seconds, peak = measure(db, read, today, args.repeat)
+                print('{:<20} {:>8} {:>10.2f} {:>12.2f} {:>14.0f}'.format(
+                    name, rows, seconds * 1000, seconds * 1e6 / rows, peak / float(rows)))
+    finally:
+        if tmpdir is not None:
+            shutil.rmtree(tmpdir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+# coding=utf-8
+# Simulates a year of reminders on a simulated clock: loads the given number
+# of dates, moves a share of them part way through (as "X moved to" would) and
+# checks that every date gets exactly its 7/1/0-day reminders.
+#
+#     python -m bench.reminders [--dates 1000,10000] [--moved 0.1]
+import argparse
+import datetime
+import random
+import time
+
+import reminders
+
+
+def simulate(count, moved_share, seed=0):
+    rng = random.Random(seed)
+    start = datetime.datetime(2026, 1, 1, 0, 0)
+    end = start + datetime.timedelta(days=366)
+    kinds = (reminders.DEADLINE, reminders.ABSTRACT, reminders.EARLY, reminders.FINAL)
+    dates = dict()
+    for i in range(count):
+        key = (kinds[i % len(kinds)], i)
+        dates[key] = ('CONF{:05d}'.format(i), start.date() + datetime.timedelta(days=rng.randrange(10, 330)))
+
+    posted = []
+    clock = reminders.SimulatedClock(start)
+    scheduler = reminders.ReminderScheduler(posted.append, clock)
+
+    load_start = time.perf_counter()
+    scheduler.load((key, item, date) for key, (item, date) in dates.items())
+    load_time = time.perf_counter() - load_start
+
+    # Halfway through February, move some dates that haven't come up yet
+    run_start = time.perf_counter()
+    scheduler.run(until=start + datetime.timedelta(days=45))
+    today = clock.now().date()
+    moved = 0
+    update_start = time.perf_counter()
+    for key, (item, date) in list(dates.items()):
+        if date - datetime.timedelta(days=7) > today and rng.random() < moved_share:
+            dates[key] = (item, date + datetime.timedelta(days=rng.randrange(1, 30)))
+            scheduler.update(key, item, dates[key][1])
+            moved += 1
+    update_time = time.perf_counter() - update_start
+    scheduler.run(until=end)
+    run_time = time.perf_counter() - run_start - update_time
+
+    # Every date, at its final value, gets each of its reminders exactly once
+    expected = set(reminders.format_reminder(kind, item, date, days)
+                   for (kind, _), (item, date) in dates.items()
+                   for days in reminders.OFFSETS)
+    assert len(posted) == len(set(posted)) == len(expected), (len(posted), len(expected))
+    assert set(posted) == expected
+    return load_time, moved, update_time, run_time, len(posted)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--dates', default='1000,10000,100000')
+    parser.add_argument('--moved', type=float, default=0.1)
+    args = parser.parse_args()
+    print('{:>8} {:>10} {:>8} {:>12} {:>12} {:>8}'.format(
+        'dates', 'load ms', 'moved', 'updates ms', 'year ms', 'posted'))
+    for count in (int(n) for n in args.dates.split(',')):
+        load_time, moved, update_time, run_time, posted = simulate(count, args.moved)
+        print('{:>8} {:>10.1f} {:>8} {:>12.1f} {:>12.1f} {:>8}'.format(
+            count, load_time * 1000, moved, update_time * 1000, run_time * 1000, posted))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,129 @@
+# coding=utf-8
+# Time to pick the command for a message before and after the router. The
+# baseline is slackbot running deadlines.py as it was at --baseline (the
+# first commit by default): every respond_to regex searched, and the groups
+# of each match taken, as slackbot's PluginsManager.get_plugins does. Now
+# slackbot only has the one catch-all pattern to search, and the router picks
+# the command. The other plugins' patterns cost the same either way and are
+# left out. The inputs are long messages: pasted CFP text, runs of
+# whitespace, and the words the old patterns stop and backtrack at.
+#
+# Python's re keeps these anchored patterns roughly linear, so neither side
+# blows up, and the times stay within the same order of magnitude except on
+# long whitespace runs. What the router changes shows in the "matches"
+# columns: one command per message, picked by precedence, where every
+# matching pattern used to run its handler.
+#
+#     python -m bench.router [--repeat N] [--sizes 1000,10000,100000]
+#                            [--baseline REVISION]
+import argparse
+import ast
+import os
+import re
+import subprocess
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def git(*args):
+    return subprocess.check_output(('git',) + args, cwd=ROOT).decode('utf-8')
+
+
+def first_commit():
+    return git('rev-list', '--max-parents=0', 'HEAD').split()[-1]
+
+
+def respond_to_patterns(source):
+    # The compiled regexes of the @respond_to decorators in a plugin's source,
+    # in the order slackbot registers them
+    patterns = []
+    for node in ast.walk(ast.parse(source)):
+        if not isinstance(node, ast.FunctionDef):
+            continue
+        for decorator in node.decorator_list:
+            if (isinstance(decorator, ast.Call) and isinstance(decorator.func, ast.Name)
+                    and decorator.func.id == 'respond_to'):
+                flags = 0
+                for arg in decorator.args[1:]:
+                    flags |= getattr(re, arg.attr)  # re.IGNORECASE and the like
+                patterns.append((node.lineno, re.compile(ast.literal_eval(decorator.args[0]), flags)))
+    return [pattern for _, pattern in sorted(patterns, key=lambda p: p[0])]
+
+
+CFP_TEXT = (
+    "Call for papers. The conference is in its tenth year and is held in Lisbon "
+    "on the waterfront. Submissions are due on May 3 and the abstract registration "
+    "deadline is on April 26. Notification is on July 1 and camera ready is due in "
+    "August; the workshop day moved to Friday this year. Authors will help review. ")
+
+
+def inputs(size):
+    return [
+        ('pasted CFP text', (CFP_TEXT * (size // len(CFP_TEXT) + 1))[:size]),
+        ('whitespace runs', 'CHI' + ' \t ' * (size // 3) + 'is'),
+        ('repeated "is"', 'is ' * (size // 3) + 'on'),
+        ('notification for ...', 'notification for ' + 'x is ' * (size // 5)),
+        ('abstract for ...', 'abstract for ' + 'a due ' * (size // 6)),
+        ('when does ...', 'when does ' + 'come ' * (size // 5) + 'back later'),
+    ]
+
+
+def time_per_call(func, text, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = func(text)
+    return (time.perf_counter() - start) / repeat, result
+
+
+def slackbot_dispatch(patterns):
+    # What slackbot does with a message: search with every pattern and take
+    # the groups of each match. Returns how many handlers would run.
+    def dispatch(text):
+        matched = 0
+        for pattern in patterns:
+            m = pattern.search(text)
+            if m:
+                m.groups()
+                matched += 1
+        return matched
+    return dispatch
+
+
+def router_dispatch(patterns, commands):
+    # The catch-all pattern(s) the plugin registers now, then the router
+    search = slackbot_dispatch(patterns)
+
+    def dispatch(text):
+        search(text)
+        handler, _ = commands.match(text)
+        return 0 if handler is None else 1
+    return dispatch
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--sizes', default='1000,10000,100000')
+    parser.add_argument('--baseline', help='git revision with the regex handlers; the first commit by default')
+    args = parser.parse_args()
+
+    import deadlines
+    baseline = args.baseline or first_commit()
+    old = slackbot_dispatch(respond_to_patterns(git('show', baseline + ':deadlines.py')))
+    with open(os.path.join(ROOT, 'deadlines.py'), encoding='utf-8') as f:
+        new = router_dispatch(respond_to_patterns(f.read()), deadlines.commands)
+
+    print('baseline: deadlines.py at {}'.format(git('rev-parse', '--short', baseline).strip()))
+    print('{:<22} {:>8} {:>12} {:>8} {:>12} {:>8}'.format(
+        'input', 'chars', 'baseline ms', 'matches', 'router ms', 'matches'))
+    for size in (int(size) for size in args.sizes.split(',')):
+        for name, text in inputs(size):
+            old_time, old_matches = time_per_call(old, text, args.repeat)
+            new_time, new_matches = time_per_call(new, text, args.repeat)
+            print('{:<22} {:>8} {:>12.3f} {:>8} {:>12.3f} {:>8}'.format(
+                name, len(text), old_time * 1000, old_matches, new_time * 1000, new_matches))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+# coding=utf-8
+# Parse time and peak memory of extracting results from WikiCFP search pages:
+# the streaming extractor in wikicfp_parser against the BeautifulSoup code it
+# replaced, on the recorded fixture page with 10 to 1000 search results.
+# Needs bs4 installed for the comparison.
+#
+#     python -m bench.wikicfp_parse [--results 10,100,1000] [--repeat 20]
+import argparse
+import time
+import tracemalloc
+from itertools import chain
+
+import wikicfp_parser
+from bench import harness
+
+CHUNK_SIZE = 16384
+ROW_START = '<tr bgcolor="#e6e6e6">\n<td rowspan="2"'
+ROWS_END = '</table>\n</td></tr>'
+
+
+def fill(page, name):
+    return (page.replace('{query}', name).replace('{name}', name)
+            .replace('{slug}', name.lower().replace(' ', '')).replace('{eventid}', '1'))
+
+
+def search_page(name, results):
+    # The recorded search page with its unrelated results repeated (under new
+    # names) until there are `results` rows, and the match last
+    page = harness.read_fixture('wikicfp_search.html')
+    first = page.index('<tr bgcolor="#f6f6f6">')
+    block = page[page.index(ROW_START):page.index(ROWS_END)]
+    rows = []
+    for i in range(results - 1):
+        rows.append(block.replace('SIGFOO 2026', 'SIGFOO{} 2026'.format(i))
+                    .replace('HCOMP 2026', 'HCOMP{} 2026'.format(i))
+                    .replace('PERFORM 2026', 'PERFORM{} 2026'.format(i)))
+    own = page[first:page.index(ROW_START)]
+    return fill(page[:first] + ''.join(rows) + own + page[page.index(ROWS_END):], name)
+
+
+def chunked(text):
+    return [text[i:i + CHUNK_SIZE] for i in range(0, len(text), CHUNK_SIZE)]
+
+
+def legacy_search(html, conference_name):
+    # The BeautifulSoup search-page code wikicfp.py had before the extractor,
+    # with the header check fixed for Python 3 so it can get as far as
+    # returning a link
+    import bs4
+    soup = bs4.BeautifulSoup(html, 'html.parser')
+    rows = soup.find_all('div', {'class': 'contsec'})[0].find_all(
+        'td', {'align': 'left'})[0].find_all('tr')
+    headers = rows[0]
+    assert list(map(str.strip, map(bs4.Tag.getText, headers.find_all('td')))) == ['Event', 'When', 'Where', 'Deadline']
+    links = []
+    for row_num in range(1, len(rows), 2):
+        try:
+            conf_info = list(chain(rows[row_num].find_all('td'), rows[row_num + 1].find_all('td')))
+            if conference_name.lower() not in conf_info[0].text.lower():
+                continue
+            links.append(conf_info[0].a['href'])
+        except Exception:
+            pass
+    assert len(links) == 1
+    return links[0]
+
+
+def new_search(html, conference_name):
+    results = wikicfp_parser.parse_search_results(chunked(html))
+    links = [r.link for r in results if conference_name.lower() in r.name.lower()]
+    assert len(links) == 1
+    return links[0]
+
+
+def measure(func, args, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    func(*args)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, harness.percentile(times, 50), peak
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--results', default='10,100,1000')
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    name = 'CHI 2027'
+    cases = []
+    for results in (int(n) for n in args.results.split(',')):
+        cases.append(('search, {} results'.format(results), legacy_search, new_search,
+                      (search_page(name, results), name)))
+
+    print('{:<22} {:>9} {:>12} {:>12} {:>12} {:>12}'.format(
+        'page', 'KB', 'bs4 ms', 'stream ms', 'bs4 peak KB', 'stream KB'))
+    for label, legacy, new, func_args in cases:
+        old_result, old_time, old_peak = measure(legacy, func_args, args.repeat)
+        new_result, new_time, new_peak = measure(new, func_args, args.repeat)
+        assert old_result == new_result, (old_result, new_result)
+        print('{:<22} {:>9.1f} {:>12.2f} {:>12.2f} {:>12.1f} {:>12.1f}'.format(
+            label, len(func_args[0]) / 1024.0, old_time * 1000, new_time * 1000,
+            old_peak / 1024.0, new_peak / 1024.0))
+
+    # The other recorded pages: no results, and an event page, which isn't
+    # a search page at all
+    empty = fill(harness.read_fixture('wikicfp_search_empty.html'), name)
+    assert wikicfp_parser.parse_search_results(empty) == []
+    event = fill(harness.read_fixture('wikicfp_event_nolink.html'), name)
+    try:
+        wikicfp_parser.parse_search_results(event)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('an event page parsed as search results')
+
+
+if __name__ == '__main__':
+    main()
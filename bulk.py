@@ -0,0 +1,250 @@
+# coding=utf-8
+# Bulk import of deadlines from an uploaded CSV or iCalendar file. The whole
+# file is parsed and checked before touching the database; clashes with the
+# existing items are found with one query for all of them, and the new rows
+# go in with executemany inserts in a single transaction. Rows that can't be imported
+# are reported by line rather than failing the whole file.
+import csv
+import datetime
+import io
+from bisect import bisect_left, insort
+from collections import namedtuple
+
+import db
+import ics
+import metrics
+import startup
+from db import Deadline, ResponseDeadline
+
+requests = startup.lazy_import('requests')
+
+# Largest file the bot will download
+MAX_IMPORT_BYTES = 1024 * 1024
+DOWNLOAD_TIMEOUT = 30
+
+# A row to import; the dates are strings from a CSV file or dates from a
+# calendar, and any but `date` may be None
+ImportRow = namedtuple('ImportRow', ['line', 'item', 'date', 'abstract_date',
+                                     'early_response_date', 'notification_date'])
+DATE_FIELDS = ('date', 'abstract_date', 'early_response_date', 'notification_date')
+
+# CSV header names for each column, once lower-cased with "_" and a trailing
+# " date" dropped; files without a header have the columns in this order
+CSV_COLUMNS = (
+    ('item', ('item', 'conference', 'name')),
+    ('date', ('deadline', 'submission', 'submission deadline', 'paper deadline')),
+    ('abstract_date', ('abstract', 'abstract deadline')),
+    ('early_response_date', ('early notification', 'early response')),
+    ('notification_date', ('notification', 'final notification', 'acceptance notification')),
+)
+_CSV_HEADERS = dict((name, field) for field, names in CSV_COLUMNS for name in names)
+_ICS_FIELDS = {ics.DEADLINE: 'date', ics.ABSTRACT: 'abstract_date',
+               ics.EARLY: 'early_response_date', ics.FINAL: 'notification_date'}
+
+
+class BulkImportError(Exception):
+    pass
+
+
+def _header_field(cell):
+    name = ' '.join(cell.lower().replace('_', ' ').split())
+    if name.endswith(' date'):
+        name = name[:-len(' date')]
+    return _CSV_HEADERS.get(name)
+
+
+def parse_csv(text):
+    # (ImportRows, errors) from CSV text, where errors are (line, message)
+    reader = csv.reader(io.StringIO(text))
+    try:
+        return _read_csv(reader)
+    except csv.Error as e:
+        raise BulkImportError("Can't read the CSV file at line {}: {}".format(reader.line_num, e))
+
+
+def _read_csv(reader):
+    rows, errors = [], []
+    fields = [field for field, _ in CSV_COLUMNS]
+    for cells in reader:
+        line = reader.line_num
+        cells = [cell.strip() for cell in cells]
+        if not any(cells):
+            continue
+        if line == 1 and _header_field(cells[0]) == 'item':
+            fields = [_header_field(cell) for cell in cells]
+            if 'date' not in fields:
+                raise BulkImportError("The header has no deadline column")
+            continue
+        values = dict((field, cell or None) for field, cell in zip(fields, cells) if field)
+        if not values.get('item') or not values.get('date'):
+            errors.append((line, "Needs a conference and a deadline"))
+            continue
+        rows.append(ImportRow(line, ' '.join(values['item'].split()),
+                              *(values.get(field) for field in DATE_FIELDS)))
+    return rows, errors
+
+
+def parse_calendar(text):
+    # (ImportRows, errors) from iCalendar text, with the events for each
+    # conference (its deadline, abstract and notifications) merged into one
+    # row at the line of its first event
+    events, errors = ics.parse(text)
+    merged = dict()
+    order = []
+    for event in events:
+        key = db.normalize_item(event.item)
+        if key not in merged:
+            merged[key] = dict(line=event.line, item=event.item)
+            order.append(key)
+        merged[key][_ICS_FIELDS[event.kind]] = event.date
+    rows = []
+    for key in order:
+        values = merged[key]
+        if 'date' not in values:
+            errors.append((values['line'], "{} has no deadline event".format(values['item'])))
+            continue
+        rows.append(ImportRow(values['line'], values['item'],
+                              *(values.get(field) for field in DATE_FIELDS)))
+    return rows, errors
+
+
+def parse_file(name, text):
+    if name.lower().endswith(('.ics', '.ical', '.ifb')) or text.lstrip().startswith('BEGIN:VCALENDAR'):
+        return parse_calendar(text)
+    return parse_csv(text)
+
+
+def _check_dates(row, verify_date):
+    # The row with its dates parsed and checked the way the chat commands
+    # check them, or an error message
+    checked = dict()
+    for field in DATE_FIELDS:
+        value = getattr(row, field)
+        if value is None:
+            checked[field] = None
+            continue
+        if isinstance(value, datetime.date):
+            if value < datetime.date.today():
+                return "{} has already passed".format(value.strftime("%b %d, %Y"))
+            checked[field] = value
+            continue
+        # Only a deadline rolls over to next year if it's earlier this year
+        valid, date = verify_date(value, strict=field != 'date')
+        if not valid:
+            return date
+        checked[field] = date
+    if checked['abstract_date'] is not None and checked['abstract_date'] > checked['date']:
+        return "Abstract deadline can't be after conference deadline"
+    for field in ('early_response_date', 'notification_date'):
+        if checked[field] is not None and checked[field] <= checked['date']:
+            return "Notification date can't be before conference deadline"
+    if (checked['early_response_date'] is not None and checked['notification_date'] is not None
+            and checked['notification_date'] <= checked['early_response_date']):
+        return "Early notification date can't be on or after final acceptance notification date"
+    return row._replace(**checked)
+
+
+def _clash(keys, key):
+    # The key in sorted `keys` that the commands' prefix lookup would confuse
+    # with `key`: one that starts with it, which they would take for it, or
+    # one it starts with, which they could no longer single out. None if
+    # there is none.
+    i = bisect_left(keys, key)
+    if i < len(keys) and keys[i].startswith(key):
+        return keys[i]
+    for end in range(len(key) - 1, 0, -1):
+        i = bisect_left(keys, key[:end], 0, i)
+        if i < len(keys) and keys[i] == key[:end]:
+            return keys[i]
+    return None
+
+
+def import_rows(session, rows, verify_date):
+    # Check `rows` and insert the ones that can be imported, in one
+    # transaction that the caller commits. Returns the DeadlineRows and
+    # ResponseRows inserted, and (line, message) for the rows that weren't.
+    errors = []
+    checked = []
+    for row in rows:
+        result = _check_dates(row, verify_date)
+        if isinstance(result, str):
+            errors.append((row.line, result))
+        else:
+            checked.append(result)
+    # Rows are checked against the items already there the way the commands
+    # look items up, by prefix, and against the rows before them in the file
+    items = dict()
+    if checked:
+        items = dict(session.query(Deadline.lookup_key, Deadline.item))
+    keys = sorted(items)
+    new = []
+    for row in checked:
+        key = db.normalize_item(row.item)
+        clash = _clash(keys, key)
+        if clash == key:
+            errors.append((row.line, "{} already exists".format(items[clash])))
+        elif clash is not None and clash.startswith(key):
+            errors.append((row.line, "{} would match {}, which already exists".format(row.item, items[clash])))
+        elif clash is not None:
+            errors.append((row.line, "{} would make {} ambiguous".format(row.item, items[clash])))
+        else:
+            insort(keys, key)
+            items[key] = row.item
+            new.append(row)
+    if not new:
+        return [], [], errors
+    session.bulk_insert_mappings(Deadline, [
+        dict(item=row.item, lookup_key=db.normalize_item(row.item), date=row.date,
+             abstract_date=row.abstract_date, old_date=None) for row in new])
+    new_keys = [db.normalize_item(row.item) for row in new]
+    ids = dict(session.query(Deadline.lookup_key, Deadline.id).filter(
+        Deadline.lookup_key.in_(new_keys)))
+    deadlines = [db.DeadlineRow(ids[key], row.item, row.date, row.abstract_date)
+                 for key, row in zip(new_keys, new)]
+    with_response = [(key, row) for key, row in zip(new_keys, new)
+                     if row.early_response_date is not None or row.notification_date is not None]
+    responses = []
+    if with_response:
+        session.bulk_insert_mappings(ResponseDeadline, [
+            dict(item=row.item, lookup_key=key, deadline_id=ids[key],
+                 early_response_date=row.early_response_date, notification_date=row.notification_date)
+            for key, row in with_response])
+        response_ids = dict(session.query(ResponseDeadline.deadline_id, ResponseDeadline.id).filter(
+            ResponseDeadline.deadline_id.in_([ids[key] for key, _ in with_response])))
+        responses = [db.ResponseRow(response_ids[ids[key]], row.item, row.early_response_date,
+                                    row.notification_date) for key, row in with_response]
+    return deadlines, responses, errors
+
+
+def uploaded_file(message):
+    # The file shared with the message, or None; Slack sends either a list
+    # of files or, from older clients, a single one
+    files = message.body.get('files') or ([message.body['file']] if message.body.get('file') else [])
+    return files[0] if files else None
+
+
+def download(file_info, token):
+    # The text of a file shared in Slack, which needs the bot's token
+    if file_info.get('size', 0) > MAX_IMPORT_BYTES:
+        raise BulkImportError("The file is too big to import (over {} KB)".format(MAX_IMPORT_BYTES // 1024))
+    url = file_info.get('url_private_download') or file_info.get('url_private')
+    if not url:
+        raise BulkImportError("Can't download that file")
+    try:
+        with metrics.timed('import_download_seconds'):
+            response = requests.get(url, headers={'Authorization': 'Bearer ' + token},
+                                    timeout=DOWNLOAD_TIMEOUT, stream=True)
+            try:
+                response.raise_for_status()
+                data = response.raw.read(MAX_IMPORT_BYTES + 1, decode_content=True)
+            finally:
+                response.close()
+    except (requests.RequestException, requests.packages.urllib3.exceptions.HTTPError) as e:
+        # The latter when the body can't be read or decompressed
+        raise BulkImportError("Couldn't download the file: {}".format(e))
+    if len(data) > MAX_IMPORT_BYTES:
+        raise BulkImportError("The file is too big to import (over {} KB)".format(MAX_IMPORT_BYTES // 1024))
+    try:
+        return data.decode('utf-8-sig')
+    except UnicodeDecodeError:
+        raise BulkImportError("The file isn't UTF-8 text")
@@ -0,0 +1,70 @@
+# coding=utf-8
+# Splitting long output into messages Slack will take. Slack caps a message
+# at 100 attachments and rejects (or silently truncates) large payloads, so
+# listings and reports are sent as a series of size-bounded messages, each
+# one as soon as it is full, rather than as one payload built up front.
+import json
+
+# Attachments per message, well under Slack's 100 so a chunk reads as one
+# screenful
+MAX_ATTACHMENTS = 20
+# Bytes of attachments JSON per message
+MAX_ATTACHMENT_BYTES = 16000
+# Characters per text message; Slack shortens longer ones
+MAX_TEXT = 3500
+
+
+def attachment_chunks(attachments):
+    # JSON payloads of at most MAX_ATTACHMENTS attachments and, unless a
+    # single attachment is bigger, MAX_ATTACHMENT_BYTES each. Consumes
+    # `attachments` lazily, so the first payload is ready as soon as its
+    # attachments are.
+    chunk, size = [], 2
+    for attachment in attachments:
+        encoded = json.dumps(attachment)
+        if chunk and (len(chunk) == MAX_ATTACHMENTS or size + len(encoded) + 2 > MAX_ATTACHMENT_BYTES):
+            yield '[' + ', '.join(chunk) + ']'
+            chunk, size = [], 2
+        chunk.append(encoded)
+        size += len(encoded) + 2
+    if chunk:
+        yield '[' + ', '.join(chunk) + ']'
+
+
+def text_chunks(lines, limit=MAX_TEXT):
+    # `lines` joined with newlines into texts of at most `limit` characters,
+    # breaking between lines; a line longer than that is split
+    chunk, size = [], 0
+    for line in lines:
+        while len(line) > limit:
+            if chunk:
+                yield '\n'.join(chunk)
+                chunk, size = [], 0
+            yield line[:limit]
+            line = line[limit:]
+        if chunk and size + len(line) + 1 > limit:
+            yield '\n'.join(chunk)
+            chunk, size = [], 0
+        chunk.append(line)
+        size += len(line) + 1
+    if chunk:
+        yield '\n'.join(chunk)
+
+
+def send_attachments(message, attachments):
+    # Post `attachments` as they come, in as many messages as it takes;
+    # returns how many
+    sent = 0
+    for payload in attachment_chunks(attachments):
+        message.send_webapi('', payload)
+        sent += 1
+    return sent
+
+
+def reply_lines(message, lines):
+    # Reply with `lines`, in as many messages as it takes
+    sent = 0
+    for text in text_chunks(lines):
+        message.reply(text)
+        sent += 1
+    return sent
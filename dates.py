@@ -0,0 +1,108 @@
+# coding=utf-8
+import datetime
+import re
+from functools import lru_cache
+
+import metrics
+import startup
+
+# dateparser takes seconds to import and most dates never need it
+dateparser = startup.lazy_import('dateparser')
+
+# Number of (date string, day) pairs whose parse results are remembered
+CACHE_SIZE = 1024
+
+# Only English is ever spoken to the bot, so skip dateparser's language
+# detection, which is most of its cost
+DATEPARSER_LANGUAGES = ['en']
+
+MONTHS = dict()
+for _number, _name in enumerate(['january', 'february', 'march', 'april', 'may',
+                                 'june', 'july', 'august', 'september',
+                                 'october', 'november', 'december'], 1):
+    MONTHS[_name] = _number
+    MONTHS[_name[:3]] = _number
+MONTHS['sept'] = 9
+
+WEEKDAYS = dict()
+for _number, _name in enumerate(['monday', 'tuesday', 'wednesday', 'thursday',
+                                 'friday', 'saturday', 'sunday']):
+    WEEKDAYS[_name] = _number
+    WEEKDAYS[_name[:3]] = _number
+
+# Words the handlers leave in front of the date ("X is on May 3")
+_PREPOSITION_RE = re.compile(r'^(?:on|by)\s+')
+_ISO_RE = re.compile(r'^(\d{4})[-/](\d{1,2})[-/](\d{1,2})$')
+_MONTH_DAY_RE = re.compile(r'^([a-z]+)\.?\s+(\d{1,2})(?:st|nd|rd|th)?(?:,?\s+(\d{4}))?$')
+_DAY_MONTH_RE = re.compile(r'^(\d{1,2})(?:st|nd|rd|th)?\s+(?:of\s+)?([a-z]+)\.?(?:,?\s+(\d{4}))?$')
+_NEXT_WEEKDAY_RE = re.compile(r'^next\s+([a-z]+)$')
+_RELATIVE_RE = re.compile(r'^in\s+(\d+|an?)\s+(day|week)s?$')
+
+
+def _month_day(month_name, day, year, today):
+    month = MONTHS.get(month_name)
+    if month is None:
+        return None
+    # Like dateparser, a date without a year is taken to be in this year
+    return datetime.date(int(year) if year else today.year, month, int(day))
+
+
+def _parse_fast(datestr, today):
+    # Recognize the handful of formats people actually use; returns None for
+    # anything else so the caller can fall back to dateparser
+    if datestr == 'today':
+        return today
+    if datestr == 'tomorrow':
+        return today + datetime.timedelta(days=1)
+    match = _ISO_RE.match(datestr)
+    if match:
+        return datetime.date(*map(int, match.groups()))
+    match = _MONTH_DAY_RE.match(datestr)
+    if match:
+        month_name, day, year = match.groups()
+        return _month_day(month_name, day, year, today)
+    match = _DAY_MONTH_RE.match(datestr)
+    if match:
+        day, month_name, year = match.groups()
+        return _month_day(month_name, day, year, today)
+    match = _NEXT_WEEKDAY_RE.match(datestr)
+    if match:
+        weekday = WEEKDAYS.get(match.group(1))
+        if weekday is None:
+            return None
+        # The first such weekday after today
+        return today + datetime.timedelta(days=(weekday - today.weekday() - 1) % 7 + 1)
+    match = _RELATIVE_RE.match(datestr)
+    if match:
+        count, unit = match.groups()
+        count = 1 if count in ('a', 'an') else int(count)
+        return today + datetime.timedelta(days=count * (7 if unit == 'week' else 1))
+    return None
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _parse(datestr, today):
+    try:
+        date = _parse_fast(_PREPOSITION_RE.sub('', datestr), today)
+    except ValueError:
+        # Out of range day or month; let dateparser have a go
+        date = None
+    if date is not None:
+        metrics.inc('date_parses_total', path='fast')
+        return date
+    metrics.inc('date_parses_total', path='dateparser')
+    with metrics.timed('dateparser_seconds'):
+        parsed = dateparser.parse(datestr, languages=DATEPARSER_LANGUAGES)
+    return parsed.date() if parsed else None
+
+
+def cache_info():
+    return _parse.cache_info()
+
+
+def parse_date(datestr, today=None):
+    # Parse a date as typed in a command, returning a datetime.date or None.
+    # Results are cached per day, since relative dates depend on it.
+    if today is None:
+        today = datetime.date.today()
+    return _parse(' '.join(datestr.split()).lower(), today)
@@ -1,15 +1,52 @@
-from sqlalchemy import create_engine, Date, Text, Column, Integer
+from sqlalchemy import create_engine, event, exc, inspect, bindparam, case, select, Date, DateTime, Text, Column, ForeignKey, Index, Integer
+from sqlalchemy.engine.url import make_url
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import joinedload, relationship, scoped_session, sessionmaker, validates
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.schema import AddConstraint, CreateColumn
 
+import datetime
+import functools
 import os
+import threading
+import time
+from bisect import bisect_left
+from collections import namedtuple
 
-engine = create_engine(os.environ.get('DATABASE_URL'), echo=True, pool_recycle=True)
+import metrics
+import startup
+
+# The engine is created by get_engine() on first use rather than at import,
+# so loading the plugins doesn't wait on it
+_engine = None
+_engine_lock = threading.Lock()
+
+# Answer item lookups from an in-process index instead of a LIKE query;
+# set ITEM_INDEX=0 to always go to the database
+USE_ITEM_INDEX = os.environ.get('ITEM_INDEX', '1') != '0'
+
+# Log every SQL statement; set SQL_ECHO=1 when debugging queries
+SQL_ECHO = os.environ.get('SQL_ECHO', '0') == '1'
+
+# Connections kept open, and opened on top of those under load; the default
+# covers the worker threads plus the background ones
+POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', '5'))
+POOL_OVERFLOW = int(os.environ.get('DB_POOL_OVERFLOW', '5'))
+# Seconds after which a connection is closed and replaced when next checked
+# out, before the server or a proxy drops it as idle
+POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE', '1800'))
+# Times an idempotent read is retried after its connection was dropped
+READ_RETRIES = 2
 
 
 Base = declarative_base()
 
 
+def normalize_item(item):
+    # Case-folded, whitespace-collapsed form of an item name used for lookups
+    return ' '.join(item.split()).casefold()
+
+
 class Deadline(Base):
     __tablename__ = 'deadlines_perform'
     id = Column(Integer, primary_key=True)
@@ -17,6 +54,25 @@ class Deadline(Base):
     item = Column(Text, nullable=False)
     abstract_date = Column(Date, nullable=True)
     old_date = Column(Date, nullable=True)
+    lookup_key = Column(Text, nullable=True)
+    # Response dates for this deadline, if any have been given; deleted along
+    # with the deadline
+    response = relationship('ResponseDeadline', uselist=False, back_populates='deadline',
+                            cascade='all, delete-orphan', passive_deletes=True)
+
+    __table_args__ = (
+        # text_pattern_ops lets Postgres use the index for LIKE 'prefix%'
+        # regardless of the database collation
+        Index('ix_deadlines_perform_lookup_key', 'lookup_key',
+              postgresql_ops={'lookup_key': 'text_pattern_ops'}),
+        # The listings only ever read upcoming dates
+        Index('ix_deadlines_perform_date', 'date'),
+    )
+
+    @validates('item')
+    def _set_lookup_key(self, key, item):
+        self.lookup_key = normalize_item(item)
+        return item
 
 
 class ResponseDeadline(Base):
@@ -25,12 +81,435 @@ class ResponseDeadline(Base):
     item = Column(Text, nullable=False)
     early_response_date = Column(Date, nullable=True)
     notification_date = Column(Date, nullable=True)
+    lookup_key = Column(Text, nullable=True)
+    deadline_id = Column(Integer, ForeignKey('deadlines_perform.id', ondelete='CASCADE',
+                                             name='fk_response_deadlines_perform_deadline_id'),
+                         nullable=True)
+    deadline = relationship('Deadline', back_populates='response')
+
+    __table_args__ = (
+        Index('ix_response_deadlines_perform_lookup_key', 'lookup_key',
+              postgresql_ops={'lookup_key': 'text_pattern_ops'}),
+        Index('ix_response_deadlines_perform_deadline_id', 'deadline_id'),
+        Index('ix_response_deadlines_perform_notification_date', 'notification_date'),
+        Index('ix_response_deadlines_perform_early_response_date', 'early_response_date'),
+    )
+
+    @validates('item')
+    def _set_lookup_key(self, key, item):
+        self.lookup_key = normalize_item(item)
+        return item
+
+
+class ArchivedDeadline(Base):
+    __tablename__ = 'deadlines_archive_perform'
+    # A deadline whose dates have all passed, with its response dates,
+    # moved here by archive.compact(). `series_key` and `year` split the name
+    # the way the WikiCFP index does, for finding the previous year's meeting.
+    id = Column(Integer, primary_key=True)
+    item = Column(Text, nullable=False)
+    lookup_key = Column(Text, nullable=False)
+    series_key = Column(Text, nullable=False)
+    year = Column(Integer, nullable=True)
+    date = Column(Date, nullable=False)
+    abstract_date = Column(Date, nullable=True)
+    old_date = Column(Date, nullable=True)
+    early_response_date = Column(Date, nullable=True)
+    notification_date = Column(Date, nullable=True)
+    archived_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index('ix_deadlines_archive_perform_lookup_key', 'lookup_key',
+              postgresql_ops={'lookup_key': 'text_pattern_ops'}),
+        Index('ix_deadlines_archive_perform_series_key', 'series_key', 'year'),
+    )
+
+
+class WikiCFPEvent(Base):
+    __tablename__ = 'wikicfp_events_perform'
+    # One event from the WikiCFP search results, keyed by its page's path.
+    # `series_key` and `year` split the normalized name, so "CHI 2027" is in
+    # series "chi" for 2027; events without a year in their name have none.
+    link = Column(Text, primary_key=True)
+    name = Column(Text, nullable=False)
+    lookup_key = Column(Text, nullable=False)
+    series_key = Column(Text, nullable=False)
+    year = Column(Integer, nullable=True)
+    title = Column(Text, nullable=True)
+    dates = Column(Text, nullable=True)
+    location = Column(Text, nullable=True)
+    # The submission deadline as WikiCFP publishes it, and parsed when possible
+    deadline = Column(Text, nullable=True)
+    deadline_date = Column(Date, nullable=True)
+    fetched_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        Index('ix_wikicfp_events_perform_lookup_key', 'lookup_key'),
+        Index('ix_wikicfp_events_perform_series_key', 'series_key', 'year'),
+    )
+
+
+class WikiCFPSeries(Base):
+    __tablename__ = 'wikicfp_series_perform'
+    # When each series was last searched for on WikiCFP
+    series_key = Column(Text, primary_key=True)
+    fetched_at = Column(DateTime, nullable=False)
+
+
+_session_factory = sessionmaker()
+# One session per thread: Session() returns the calling thread's, and the
+# worker pool discards it after each command (see remove_session)
+_sessions = scoped_session(_session_factory)
+
+
+class _TimedQueuePool(QueuePool):
+    # Times every checkout, including waiting for a free connection and
+    # opening a new one
+    def connect(self):
+        start = time.time()
+        try:
+            return super(_TimedQueuePool, self).connect()
+        finally:
+            metrics.observe('db_checkout_seconds', time.time() - start)
+
+
+def get_engine():
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            url = make_url(os.environ.get('DATABASE_URL'))
+            options = dict(echo=SQL_ECHO, pool_recycle=POOL_RECYCLE)
+            # SQLite connections can't be shared between threads, so it keeps
+            # its default pool
+            if not url.drivername.startswith('sqlite'):
+                options.update(poolclass=_TimedQueuePool, pool_size=POOL_SIZE,
+                               max_overflow=POOL_OVERFLOW)
+            with startup.timed('create database engine'):
+                _engine = create_engine(url, **options)
+            event.listen(_engine, 'before_cursor_execute', _before_cursor_execute)
+            event.listen(_engine, 'after_cursor_execute', _after_cursor_execute)
+            event.listen(_engine, 'do_connect', _do_connect)
+            event.listen(_engine, 'engine_connect', _ping_connection)
+            event.listen(_engine.pool, 'connect', _pool_connect)
+            event.listen(_engine.pool, 'checkout', _pool_checkout)
+            event.listen(_engine.pool, 'invalidate', _pool_invalidate)
+            _session_factory.configure(bind=_engine)
+    return _engine
+
+
+def pool_status():
+    # For the "stats" command
+    return get_engine().pool.status()
+
+
+def _do_connect(dialect, connection_record, cargs, cparams):
+    # Opening a connection (a TLS handshake on Heroku) is what recycling too
+    # often costs, so it gets its own histogram
+    start = time.time()
+    try:
+        return dialect.connect(*cargs, **cparams)
+    finally:
+        metrics.observe('db_connect_seconds', time.time() - start)
+
+
+def _ping_connection(connection, branch):
+    # Check a connection is alive before handing it out, from SQLAlchemy's
+    # "pessimistic disconnect handling" recipe: a dropped connection fails
+    # the ping, is invalidated, and the retried ping opens a fresh one
+    if branch:
+        return
+    should_close_with_result = connection.should_close_with_result
+    connection.should_close_with_result = False
+    try:
+        connection.scalar(select([1]))
+    except exc.DBAPIError as e:
+        if not e.connection_invalidated:
+            raise
+        metrics.inc('db_ping_failures_total')
+        connection.scalar(select([1]))
+    finally:
+        connection.should_close_with_result = should_close_with_result
+
+
+def _pool_connect(dbapi_connection, connection_record):
+    connection_record.info['new'] = True
+
+
+def _pool_checkout(dbapi_connection, connection_record, connection_proxy):
+    # Counted by whether the connection was opened for this checkout, so the
+    # stats show how much the pool churns
+    new = connection_record.info.pop('new', False)
+    metrics.inc('db_checkouts_total', result='new' if new else 'reused')
+
+
+def _pool_invalidate(dbapi_connection, connection_record, exception):
+    metrics.inc('db_invalidated_total')
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    context._metrics_start = time.time()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Charged to the command running on this thread, if any
+    metrics.observe('sql_seconds', time.time() - context._metrics_start,
+                    command=metrics.current_command() or 'background')
+
+
+def Session():
+    # The calling thread's session. Closing it ends its transaction and
+    # returns its connection to the pool; the next Session() on the thread
+    # starts afresh.
+    get_engine()
+    return _sessions()
+
+
+def remove_session():
+    # Close and discard the calling thread's session, so nothing a command
+    # left behind (an unfinished transaction, a broken connection) carries
+    # over to the next one
+    _sessions.remove()
+
+
+def _track_flush(session, flush_context):
+    session.info['flushed'] = True
+
+
+def _end_transaction(session, transaction):
+    if transaction.parent is None:
+        session.info.pop('flushed', None)
+
+
+event.listen(_session_factory, 'after_flush', _track_flush)
+event.listen(_session_factory, 'after_transaction_end', _end_transaction)
+
+
+def retry_read(func):
+    # Decorator for functions that take a session first and only read. If
+    # the connection is dropped under them, the session is rolled back and
+    # they are run again, up to READ_RETRIES times; unless the session has
+    # already written something in this transaction, which a retry would
+    # silently lose. A retry gets the same arguments, so they must be
+    # reusable: a generator would already be used up.
+    @functools.wraps(func)
+    def wrapper(session, *args, **kwargs):
+        for attempt in range(READ_RETRIES + 1):
+            try:
+                return func(session, *args, **kwargs)
+            except exc.DBAPIError as e:
+                if (not e.connection_invalidated or attempt == READ_RETRIES
+                        or session.info.get('flushed') or session.new or session.dirty or session.deleted):
+                    raise
+                metrics.inc('db_read_retries_total')
+                session.rollback()
+    return wrapper
+
+
+# Bumped whenever a command handler commits a change to the deadline tables,
+# so anything derived from them knows to rebuild
+_data_version = 0
+_data_version_lock = threading.Lock()
+_change_listeners = []
+
+
+def data_version():
+    return _data_version
+
+
+def bump_data_version():
+    global _data_version
+    with _data_version_lock:
+        _data_version += 1
+    for listener in _change_listeners:
+        listener()
+
+
+def add_change_listener(listener):
+    _change_listeners.append(listener)
+
+
+class ItemIndex(object):
+    # Sorted in-process copy of a table's lookup keys. Exact and prefix
+    # lookups are answered by bisection; the index reloads itself (one query)
+    # the first time it is used after the data version changes.
+    def __init__(self, table):
+        self.table = table
+        self._version = None
+        self._keys = []
+        self._ids = []
+        self._lock = threading.Lock()
+
+    def _load(self, session):
+        with self._lock:
+            version = data_version()
+            if self._version != version:
+                rows = session.query(self.table.lookup_key, self.table.id).order_by(
+                    self.table.lookup_key, self.table.id).all()
+                self._keys = [key for key, _ in rows]
+                self._ids = [row_id for _, row_id in rows]
+                self._version = version
+            return self._keys, self._ids
+
+    def lookup_ids(self, item, session):
+        key = normalize_item(item)
+        keys, ids = self._load(session)
+        matches = []
+        for i in range(bisect_left(keys, key), len(keys)):
+            if not keys[i].startswith(key):
+                break
+            matches.append(ids[i])
+        return matches
+
+
+_item_indexes = dict()
+
+
+def item_index(table):
+    if table not in _item_indexes:
+        _item_indexes[table] = ItemIndex(table)
+    return _item_indexes[table]
+
+
+@retry_read
+def find_deadlines(session, item, with_response=False):
+    # Deadlines whose item starts with `item` once both are normalized, or
+    # that match it as a LIKE pattern if it contains % wildcards. With
+    # `with_response`, each deadline's response dates are loaded by the same
+    # query, so a command needs a single round trip.
+    query = session.query(Deadline)
+    if with_response:
+        query = query.options(joinedload(Deadline.response))
+    if USE_ITEM_INDEX and '%' not in item:
+        ids = item_index(Deadline).lookup_ids(item, session)
+        if not ids:
+            return []
+        query = query.filter(Deadline.id.in_(ids))
+    else:
+        key = normalize_item(item)
+        if '%' not in key:
+            key += '%'  # prefix search
+        query = query.filter(Deadline.lookup_key.like(key))
+    return query.order_by(Deadline.id).all()
+
+
+# Read-only records for the listings: plain tuples straight from a Core
+# select, without the ORM's identity map and attribute instrumentation
+DeadlineRow = namedtuple('DeadlineRow', ['id', 'item', 'date', 'abstract_date'])
+ResponseRow = namedtuple('ResponseRow', ['id', 'item', 'early_response_date', 'notification_date'])
+
+
+def _rows(session, record, query):
+    return [record._make(row) for row in session.execute(query)]
+
+
+@retry_read
+def upcoming_deadlines(session, today, horizon=None, limit=None):
+    # DeadlineRows on or after `today` (and, with a horizon, no later than
+    # that many days after it), soonest first
+    deadlines = Deadline.__table__
+    query = select([deadlines.c.id, deadlines.c.item, deadlines.c.date,
+                    deadlines.c.abstract_date]).where(deadlines.c.date >= today)
+    if horizon is not None:
+        query = query.where(deadlines.c.date <= today + datetime.timedelta(days=horizon))
+    query = query.order_by(deadlines.c.date)
+    if limit is not None:
+        query = query.limit(limit)
+    return _rows(session, DeadlineRow, query)
+
+
+@retry_read
+def upcoming_responses(session, today, horizon=None, limit=None):
+    # ResponseRows with an early or final notification on or after `today`
+    # (and, with a horizon, within that many days), ordered and limited by
+    # the next of the two to come. Either date may be NULL; since an early
+    # notification always comes before the final one, the next date is the
+    # early one until it has passed.
+    responses = ResponseDeadline.__table__
+    next_date = case([(responses.c.early_response_date >= today, responses.c.early_response_date)],
+                     else_=responses.c.notification_date)
+    query = select([responses.c.id, responses.c.item, responses.c.early_response_date,
+                    responses.c.notification_date]).where(next_date >= today)
+    if horizon is not None:
+        query = query.where(next_date <= today + datetime.timedelta(days=horizon))
+    query = query.order_by(next_date)
+    if limit is not None:
+        query = query.limit(limit)
+    return _rows(session, ResponseRow, query)
+
+
+def _add_missing_columns(table, columns):
+    engine = get_engine()
+    for column in table.__table__.columns:
+        if column.name not in columns:
+            engine.execute('ALTER TABLE {} ADD COLUMN {}'.format(
+                table.__tablename__, CreateColumn(column).compile(engine)))
+            # SQLite can't add constraints to an existing table; there the
+            # foreign key is only enforced by the ORM
+            if engine.dialect.name != 'sqlite':
+                for foreign_key in column.foreign_keys:
+                    engine.execute(AddConstraint(foreign_key.constraint))
+
+
+def _add_missing_indexes(table, indexes):
+    for index in table.__table__.indexes:
+        if index.name not in indexes:
+            index.create(get_engine())
+
+
+def _backfill_lookup_keys(table, batch_size=500):
+    update = table.__table__.update().where(
+        table.__table__.c.id == bindparam('row_id')).values(
+        lookup_key=bindparam('key'))
+    while True:
+        rows = get_engine().execute(table.__table__.select().with_only_columns(
+            [table.__table__.c.id, table.__table__.c.item]).where(
+            table.__table__.c.lookup_key == None).limit(batch_size)).fetchall()
+        if not rows:
+            break
+        get_engine().execute(update, [{'row_id': row_id, 'key': normalize_item(item)}
+                                      for row_id, item in rows])
+
+
+def _backfill_response_deadline_ids():
+    # Response dates used to be tied to their deadline only by item name
+    responses = ResponseDeadline.__table__
+    deadlines = Deadline.__table__
+    get_engine().execute(responses.update().where(
+        responses.c.deadline_id == None).values(
+        deadline_id=select([deadlines.c.id]).where(
+            deadlines.c.item == responses.c.item).limit(1).as_scalar()))
+
+
+# Tables older versions of the bot created that nothing uses any more:
+# wikicfp_cache_perform held the per-name WikiCFP lookups the index replaced
+RETIRED_TABLES = ('wikicfp_cache_perform',)
 
 
-Session = sessionmaker(bind=engine)
+def migrate():
+    # Bring tables created by an older version of the bot up to date: add
+    # new columns, fill them in for existing rows, build missing indexes and
+    # drop retired tables
+    inspector = inspect(get_engine())
+    for table in (Deadline, ResponseDeadline):
+        columns = set(c['name'] for c in inspector.get_columns(table.__tablename__))
+        indexes = set(i['name'] for i in inspector.get_indexes(table.__tablename__))
+        _add_missing_columns(table, columns)
+        _backfill_lookup_keys(table)
+        _add_missing_indexes(table, indexes)
+    _backfill_response_deadline_ids()
+    existing = set(inspector.get_table_names())
+    for name in RETIRED_TABLES:
+        if name in existing:
+            get_engine().execute('DROP TABLE {}'.format(name))
 
 
 if __name__ == '__main__':
-    # Create the table for the first time
-    Deadline.__table__.create(engine)
-    ResponseDeadline.__table__.create(engine)
\ No newline at end of file
+    # Create the tables for the first time; tables that already exist are
+    # left alone and migrated, so this can be rerun after every upgrade
+    engine = get_engine()
+    Deadline.__table__.create(engine, checkfirst=True)
+    ResponseDeadline.__table__.create(engine, checkfirst=True)
+    ArchivedDeadline.__table__.create(engine, checkfirst=True)
+    WikiCFPEvent.__table__.create(engine, checkfirst=True)
+    WikiCFPSeries.__table__.create(engine, checkfirst=True)
+    migrate()
@@ -1,41 +1,64 @@
 # coding=utf-8
+from slackbot import settings
 from slackbot.bot import listen_to, respond_to
+from slackbot.manager import PluginsManager
 
 import datetime
-import json
 import re
-import sys, traceback
-from itertools import chain
-
-try:
-    import bs4
-except:
-    import BeautifulSoup as bs4
-import dateparser
-import dateutil.parser
-import requests
 
+import archive
+import bulk
+import chunked
+import dates
 import db
+import digest
+import ics
+import metrics
+import reminders
+import router
+import workers
 from db import Deadline, ResponseDeadline
 
 #session = db.Session()
-_cfp_url_cache, _true_cfp_url_cache = dict(), dict()
+
+commands = router.Router()
+
+# Longest item name and date, in words, that a command accepts; anything
+# longer is pasted text that happens to contain "on" or "moved to"
+MAX_ITEM_WORDS = 12
+MAX_DATE_WORDS = 6
+
+RESPONSE_WORDS = ('response', 'notification')
+
+# Rows of an import's error report shown in the reply
+MAX_REPORTED_ERRORS = 100
 
 
-def query_for_item(item, session, table=Deadline, field=Deadline.item):
-    if '%' not in item:
-        item += '%'  # prefix search
-    results = list(session.query(table).filter(field.like(item)))
-    return results
+def split_item_and_date(tokens, start, prepositions, filler):
+    # Split the words from `start` on at the last of `prepositions` into the
+    # item before it (minus a trailing `filler` word, as in "X is on ...") and
+    # the date after it, which keeps the preposition
+    split = tokens.rindex(prepositions, start + 1, len(tokens) - 1)
+    if split < 0:
+        return None
+    item_stop = split
+    if tokens.words[item_stop - 1] == filler and item_stop - 1 > start:
+        item_stop -= 1
+    if item_stop - start > MAX_ITEM_WORDS or len(tokens) - split - 1 > MAX_DATE_WORDS:
+        return None
+    return tokens.text(start, item_stop), tokens.text(split)
+
+
+def contains_word(tokens, predicate):
+    return any(predicate(word) for word in tokens.words)
 
 
 def parse_and_verify_date(datestr, strict=False):
-    parsed = dateparser.parse(datestr)
-    if not parsed:
+    today = datetime.date.today()
+    date = dates.parse_date(datestr, today)
+    if not date:
         # can't parse so ignore the date
         return False, "Can't parse date {}".format(datestr)
-    date = parsed.date()
-    today = datetime.date.today()
     if date < today:
         if date.year == today.year and not strict:
             date = date.replace(year=date.year + 1)
@@ -46,66 +69,21 @@ def parse_and_verify_date(datestr, strict=False):
     return True, date
 
 
-def get_cfp_from_wikicfp(conf_wikicfp_url):
-    global _true_cfp_url_cache
-    if conf_wikicfp_url in _true_cfp_url_cache:
-        return _true_cfp_url_cache[conf_wikicfp_url]
-    resp = requests.get(conf_wikicfp_url)
-    soup = bs4.BeautifulSoup(resp.text)
-    rows = soup.findAll(
-        'div', {'class': 'contsec'})[0].findAll('td', {'align': 'center'})
-    return [r for r in rows[:5] if "Link:" in r.text][0].a['href']
-
-
-def get_conf_wikicfp_url(conference_name, try_get_true_cfp=False):
-    global _cfp_url_cache
-    if conference_name in _cfp_url_cache:
-        return _cfp_url_cache[conference_name]
-
-    WIKICFP_URL = "http://wikicfp.com"
-    resp = requests.get(
-        WIKICFP_URL + "/cfp/servlet/tool.search?q={conference_name}&year=a".format(
-            conference_name=conference_name.replace(' ', '+')))
-    soup = bs4.BeautifulSoup(resp.text)
-    rows = soup.findAll(
-        'div', {'class': 'contsec'})[0].findAll(
-        'td', {'align': 'left'})[0].findAll('tr')
-    headers = rows[0]
-    # Make sure the page we got was valid
-    assert map(unicode.strip, map(bs4.Tag.getText, headers.contents)) == ['Event', 'When', 'Where', 'Deadline']
-    links = []
-    for row_num in range(1, len(rows), 2):
-        try:
-            conf_info = list(chain(rows[row_num].findAll('td'),
-                                   rows[row_num + 1].findAll('td')))
-            if conference_name.lower() not in conf_info[0].text.lower():
-                continue
-            shortname, name, dates, location, deadlines = tuple(
-                t.text for t in conf_info)
-            conf_wikicfp_url = WIKICFP_URL + conf_info[0].a['href']
-            links.append(conf_wikicfp_url)
-        except:
-            ##traceback.print_exc()
-            ##sys.stderr.write("Row %d doesn't contain a conference entry.\n" % (row_num,))
-            pass
-    # There should only be one matching link; if there are multiple, the query
-    # was not specific enough, and if there is none, the CFP isn't on WikiCFP
-    assert len(links) == 1
-    _cfp_url_cache[conference_name] = links[0]
-
-    # Optionally, try to get the conference's CFP URL, not just the WikiCFP page
-    if try_get_true_cfp:
-        try:
-            return get_cfp_from_wikicfp(links[0])
-        except:
-            pass
-    return links[0]
-
-
-@respond_to(r'^((?!abstract).*\S(?<!is))(\s+is)?\s+((on|in)\s+\S.*)', re.IGNORECASE)
-def set_deadline(message, item, _, datestr, __):
+def parse_set_deadline(tokens):
+    # conference (is)? (on|in) date
+    if not tokens or tokens.words[0].startswith('abstract'):
+        return None
+    parsed = split_item_and_date(tokens, 0, ('on', 'in'), 'is')
+    if parsed is None:
+        return None
+    item = parsed[0].lower()
     if 'response' in item or 'notification' in item:
-        return
+        return None
+    return parsed
+
+
+@commands.command(parse_set_deadline, precedence=70)
+def set_deadline(message, item, datestr):
     date_is_valid, date = parse_and_verify_date(datestr)
     if not date_is_valid:
         error_msg = date
@@ -113,7 +91,7 @@ def set_deadline(message, item, _, datestr, __):
         return
     session = db.Session()
     try:
-        q = query_for_item(item, session)
+        q = db.find_deadlines(session, item)
         if q:
             datestr = q[0].date.strftime("%b %d, %Y")
             message.reply("Deadline already exists! {} is on {}".format(item,
@@ -123,6 +101,8 @@ def set_deadline(message, item, _, datestr, __):
             d = Deadline(date=date, item=item, abstract_date=None, old_date=None)
             session.add(d)
             session.commit()
+            db.bump_data_version()
+            reminders.deadline_changed(d)
             message.reply("Set deadline: {} is on {}".format(item, datestr))
     except:
         session.rollback()
@@ -132,8 +112,15 @@ def set_deadline(message, item, _, datestr, __):
         session.close()
 
 
-@respond_to(r'^abstract\s+for\s+(.*\S(?<!due))(\s+due)?\s+((on|by)\s+\S.*)', re.IGNORECASE)
-def add_abstract_deadline(message, item, _, datestr, ___):
+def parse_abstract_deadline(tokens):
+    # abstract for conference (due)? (on|by) date
+    if not tokens.startswith(('abstract', 'for')):
+        return None
+    return split_item_and_date(tokens, 2, ('on', 'by'), 'due')
+
+
+@commands.command(parse_abstract_deadline, precedence=40)
+def add_abstract_deadline(message, item, datestr):
     date_is_valid, date = parse_and_verify_date(datestr, strict=True)
     if not date_is_valid:
         error_msg = date
@@ -142,7 +129,7 @@ def add_abstract_deadline(message, item, _, datestr, ___):
     # Look up existing item
     session = db.Session()
     try:
-        q = query_for_item(item, session)
+        q = db.find_deadlines(session, item)
         if not q:
             message.reply("No matching deadlines")
         elif len(q) > 1:
@@ -161,6 +148,8 @@ def add_abstract_deadline(message, item, _, datestr, ___):
                           "abstract for {} is due on {}".format(q[0].item, datestr))
             q[0].abstract_date = date
             session.commit()
+            db.bump_data_version()
+            reminders.deadline_changed(q[0])
     except:
         session.rollback()
         message.reply("Encountered error when adding abstract deadline")
@@ -169,13 +158,34 @@ def add_abstract_deadline(message, item, _, datestr, ___):
         session.close()
 
 
-@respond_to(r'^(early\s+(reject\s+)?|first\s+round\s+|(final\s+)?(acceptance\s+)?)(response\s+|notification\s+)for\s+(.*\S(?<!is))(\s+is)?\s+((on|by)\s+\S.*)', re.IGNORECASE)
-# Accepts commands of the form:
-#     "(first round|early|early reject) (response|notification) for conference is (on|by) date"
-# for early reject/first round notification dates, and of the form:
-#     "(final)? (acceptance)? (response|notification) for conference is (on|by) date"
-# for final notification dates.
-def add_notification_date(message, notification_type, _, __, ___, ____, item, _____, datestr, ______):
+def parse_notification_date(tokens):
+    # Accepts commands of the form:
+    #     "(first round|early|early reject) (response|notification) for conference is (on|by) date"
+    # for early reject/first round notification dates, and of the form:
+    #     "(final)? (acceptance)? (response|notification) for conference is (on|by) date"
+    # for final notification dates.
+    if tokens.startswith(('early', 'reject')) or tokens.startswith(('first', 'round')):
+        i = 2
+    elif tokens.startswith(('early',)):
+        i = 1
+    else:
+        i = 0
+        if tokens.startswith(('final',), i):
+            i += 1
+        if tokens.startswith(('acceptance',), i):
+            i += 1
+    if i >= len(tokens) or tokens.words[i] not in RESPONSE_WORDS:
+        return None
+    if not tokens.startswith(('for',), i + 1):
+        return None
+    parsed = split_item_and_date(tokens, i + 2, ('on', 'by'), 'is')
+    if parsed is None:
+        return None
+    return (' '.join(tokens.words[:i]),) + parsed
+
+
+@commands.command(parse_notification_date, precedence=50)
+def add_notification_date(message, notification_type, item, datestr):
     date_is_valid, date = parse_and_verify_date(datestr, strict=True)
     if not date_is_valid:
         error_msg = date
@@ -195,7 +205,7 @@ def add_notification_date(message, notification_type, _, __, ___, ____, item, __
     # Look up existing item
     session = db.Session()
     try:
-        q = query_for_item(item, session)
+        q = db.find_deadlines(session, item, with_response=True)
         if not q:
             message.reply("No matching deadlines")
         elif len(q) > 1:
@@ -209,12 +219,11 @@ def add_notification_date(message, notification_type, _, __, ___, ____, item, __
                                                    q[0].item, datestr))
                 return
 
-            resp = query_for_item(item, session, ResponseDeadline, ResponseDeadline.item)
-            if not resp:
+            r = q[0].response
+            if r is None:
                 r = ResponseDeadline(item=q[0].item, early_response_date=None, notification_date=None)
-                session.add(r)
+                q[0].response = r
             else:
-                r = resp[0]  # there should be only one because Deadline.item acts as a de facto foreign key constraint
                 # Make sure the early response date is after the acceptance notification date, if both exist
                 early_response_date = (date if updated_field == 'early_response_date' else
                                        r.early_response_date if r.early_response_date is not None else None)
@@ -237,6 +246,8 @@ def add_notification_date(message, notification_type, _, __, ___, ____, item, __
                                                               r.item, datestr))
             setattr(r, updated_field, date)
             session.commit()
+            db.bump_data_version()
+            reminders.response_changed(r)
     except:
         session.rollback()
         message.reply("Encountered error when adding {} date".format(notification_type))
@@ -245,29 +256,40 @@ def add_notification_date(message, notification_type, _, __, ___, ____, item, __
         session.close()
 
 
-@respond_to('^when\s+does\s+(.*\S(?<!come))\s+come\s+back\??$', re.IGNORECASE)
+def parse_get_notification_date(tokens):
+    # when does conference come back?
+    if len(tokens) < 5 or not tokens.startswith(('when', 'does')):
+        return None
+    if not tokens.startswith(('come', 'back'), len(tokens) - 2):
+        return None
+    if len(tokens) - 4 > MAX_ITEM_WORDS:
+        return None
+    return (tokens.text(2, len(tokens) - 2),)
+
+
+@commands.command(parse_get_notification_date, precedence=30)
 def get_notification_date(message, item):
     session = db.Session()
     try:
-        q = query_for_item(item, session)
+        q = db.find_deadlines(session, item, with_response=True)
         if not q:
             message.reply("No matching deadlines")
         elif len(q) > 1:
             message.reply("More than one matching deadline: {}".format(', '.join(x.item
                                                                                  for x in q)))
         else:
-            r = query_for_item(q[0].item, session, ResponseDeadline, ResponseDeadline.item)
-            if not r or (not r[0].early_response_date and not r[0].notification_date):
-                message.reply("I don't have any notification dates for {}! Maybe you can provide them... ( ͡° ͜ʖ ͡°)".format(q[0].item if not r else r[0].item))
+            r = q[0].response
+            if not r or (not r.early_response_date and not r.notification_date):
+                message.reply("I don't have any notification dates for {}! Maybe you can provide them... ( ͡° ͜ʖ ͡°)".format(q[0].item if not r else r.item))
                 return
             response = ""
-            if r[0].early_response_date:
-                datestr = r[0].early_response_date.strftime("%b %d, %Y")
-                response += "early notification for {} comes back by {}".format(r[0].item, datestr)
-            if r[0].notification_date:
-                datestr = r[0].notification_date.strftime("%b %d, %Y")
+            if r.early_response_date:
+                datestr = r.early_response_date.strftime("%b %d, %Y")
+                response += "early notification for {} comes back by {}".format(r.item, datestr)
+            if r.notification_date:
+                datestr = r.notification_date.strftime("%b %d, %Y")
                 response += "{}final acceptance notification{} comes by {}".format(
-                    " and " if response else "", " for {}".format(r[0].item) if not response else "", datestr)
+                    " and " if response else "", " for {}".format(r.item) if not response else "", datestr)
             message.reply(response[0].upper() + response[1:] + '.')
     except:
         session.rollback()
@@ -276,11 +298,31 @@ def get_notification_date(message, item):
         session.close()
 
 
-@respond_to(r'^clear\s+(early\s+(reject\s+)?|first\s+round\s+)(response\s+|notification\s+)(date\s+)?for\s+(.*)', re.IGNORECASE)
-def clear_early_notification_date(message, notification_type, _, __, ___, item):
+def parse_clear_early_notification_date(tokens):
+    # clear (early|early reject|first round) (response|notification) (date)? for conference
+    if not tokens.startswith(('clear',)):
+        return None
+    if tokens.startswith(('early', 'reject'), 1) or tokens.startswith(('first', 'round'), 1):
+        i = 3
+    elif tokens.startswith(('early',), 1):
+        i = 2
+    else:
+        return None
+    if i >= len(tokens) or tokens.words[i] not in RESPONSE_WORDS:
+        return None
+    i += 1
+    if tokens.startswith(('date',), i):
+        i += 1
+    if not tokens.startswith(('for',), i) or not 0 < len(tokens) - i - 1 <= MAX_ITEM_WORDS:
+        return None
+    return (tokens.text(i + 1),)
+
+
+@commands.command(parse_clear_early_notification_date, precedence=20)
+def clear_early_notification_date(message, item):
     session = db.Session()
     try:
-        q = query_for_item(item, session)
+        q = db.find_deadlines(session, item, with_response=True)
         if not q:
             message.reply("No matching deadlines")
             return
@@ -289,13 +331,15 @@ def clear_early_notification_date(message, notification_type, _, __, ___, item):
                                                                                  for x in q)))
             return
 
-        r = query_for_item(q[0].item, session, ResponseDeadline, ResponseDeadline.item)
-        if not r or not r[0].early_response_date:
-            message.reply("No early notification date is set for {}".format(r[0].item))
+        r = q[0].response
+        if not r or not r.early_response_date:
+            message.reply("No early notification date is set for {}".format(q[0].item))
         else:
-            message.reply("Cleared early notification date for {}".format(r[0].item))
-            r[0].early_response_date = None
+            message.reply("Cleared early notification date for {}".format(r.item))
+            r.early_response_date = None
             session.commit()
+            db.bump_data_version()
+            reminders.response_changed(r)
     except:
         session.rollback()
         raise
@@ -303,8 +347,23 @@ def clear_early_notification_date(message, notification_type, _, __, ___, item):
         session.close()
 
 
-@respond_to(r'^(.*\S(?<!moved))(\s+moved)\s+to\s+(\S.*)', re.IGNORECASE)
-def change_deadline(message, item, _, datestr):
+def parse_change_deadline(tokens):
+    # conference moved to date
+    stop = len(tokens) - 2
+    while True:
+        moved = tokens.rindex(('moved',), 1, stop)
+        if moved < 0:
+            return None
+        if tokens.words[moved + 1] == 'to':
+            break
+        stop = moved
+    if moved > MAX_ITEM_WORDS or len(tokens) - moved - 2 > MAX_DATE_WORDS:
+        return None
+    return tokens.text(0, moved), tokens.text(moved + 2)
+
+
+@commands.command(parse_change_deadline, precedence=60)
+def change_deadline(message, item, datestr):
     date_is_valid, date = parse_and_verify_date(datestr)
     if not date_is_valid:
         error_msg = date
@@ -312,7 +371,7 @@ def change_deadline(message, item, _, datestr):
         return
     session = db.Session()
     try:
-        q = query_for_item(item, session)
+        q = db.find_deadlines(session, item)
         if not q:
             message.reply("No existing deadline for {}".format(item))
         elif len(q) > 1:
@@ -323,6 +382,8 @@ def change_deadline(message, item, _, datestr):
             q[0].old_date = q[0].date
             q[0].date = date
             session.commit()
+            db.bump_data_version()
+            reminders.deadline_changed(q[0])
             datestr = date.strftime("%b %d, %Y")
             message.reply("Deadline updated{}: {} is now on {}".format(
                 " again" if again else "", item, datestr))
@@ -334,128 +395,60 @@ def change_deadline(message, item, _, datestr):
         session.close()
 
 
+def parse_list_deadlines(tokens):
+    # deadlines, anywhere in the message
+    return () if contains_word(tokens, lambda word: 'deadline' in word) else None
+
+
 @listen_to(r'^deadlines?', re.IGNORECASE)
-@respond_to(r'deadlines?', re.IGNORECASE)
+@workers.queued
+@commands.command(parse_list_deadlines, precedence=90)
 def list_deadlines(message):
-    attachments = []
-    session = db.Session()
-    error = False
     try:
-        for deadline in session.query(Deadline).order_by(Deadline.date):
-            days = (deadline.date - datetime.date.today()).days
-            if days < 0:
-                continue
-            attach = {"mrkdwn_in": ["text"]}
-            try:
-                deadline_text = '<{cfp_url}|{conf_name}>'.format(
-                    cfp_url=get_conf_wikicfp_url(deadline.item),
-                    conf_name=deadline.item)
-            except:
-                deadline_text = deadline.item
-            if days > 1:
-                abstract_message = ""
-                if deadline.abstract_date != None:
-                    abstract_days = (deadline.abstract_date - datetime.date.today()).days
-                    if abstract_days < 0:
-                        abstract_message = ""
-                    elif abstract_days == 0:
-                        abstract_message = " (*abstract due TODAY!*)"
-                    elif abstract_days == 1:
-                        abstract_message = " (abstract due tomorrow)"
-                    else:
-                        abstract_message = " (abstract due in {} days)".format(
-                            abstract_days)
-                attach["text"] = "{} days until {}{}".format(days, deadline_text,
-                                                             abstract_message)
-            elif days == 1:
-                attach["text"] = "*{} tomorrow!*".format(deadline_text)
-            else:
-                attach["text"] = "*{} TODAY!*".format(deadline_text)
-                attach["color"] = "#ff0000"
-            if days < 7 and days > 0:
-                attach["color"] = "#ffff00"
-            attachments.append(attach)
+        sent = digest.send_listing(digest.DEADLINES, lambda payload: message.send_webapi('', payload))
     except:
-        session.rollback()
         message.reply("Exception on query!")
-        error = True
         raise
-    finally:
-        if not error:
-            if attachments:
-                message.send_webapi('', json.dumps(attachments))
-            else:
-                message.reply("No deadlines!")
-        session.close()
+    if not sent:
+        message.reply("No deadlines!")
+
+
+def parse_list_notification_dates(tokens):
+    # notification dates, anywhere in the message
+    for i in range(len(tokens) - 1):
+        if tokens.words[i] == 'notification' and tokens.words[i + 1] in ('date', 'dates'):
+            return ()
+    return None
 
 
 @listen_to(r'^notification\s+dates?', re.IGNORECASE)
-@respond_to(r'notification\s+dates?', re.IGNORECASE)
+@workers.queued
+@commands.command(parse_list_notification_dates, precedence=80)
 def list_notification_dates(message):
-    notifications = []
-    session = db.Session()
-    error = False
     try:
-        for deadline in session.query(ResponseDeadline).order_by(ResponseDeadline.notification_date):
-            days = (deadline.notification_date - datetime.date.today()).days
-            if days < 0:
-                continue
-            try:
-                deadline_text = '<{cfp_url}|{conf_name}>'.format(
-                    cfp_url=get_conf_wikicfp_url(deadline.item),
-                    conf_name=deadline.item)
-            except:
-                deadline_text = deadline.item
-
-            # Early notifications
-            if deadline.early_response_date != None:
-                early_notification_days = (deadline.early_response_date - datetime.date.today()).days
-                if early_notification_days >= 0:
-                    early_notif = {"mrkdwn_in": ["text"]}
-                    if early_notification_days == 0:
-                        early_notif["text"] = "*Early notifications for {} come back TODAY!*".format(deadline_text)
-                    elif early_notification_days == 1:
-                        early_notif["text"] = "Early notifications for {} come back tomorrow".format(deadline_text)
-                    else:
-                        early_notif["text"] = "Early notifications for {} come back in {} days".format(deadline_text, early_notification_days)
-                    notifications.append((early_notification_days, early_notif))
-
-            # Final notifications
-            notif = {"mrkdwn_in": ["text"]}
-            if days > 1:
-                notif["text"] = "Final notifications for {} come back in {} days".format(deadline_text, days)
-            elif days == 1:
-                notif["text"] = "*Final notifications for {} come back tomorrow!*".format(deadline_text)
-            else:
-                notif["text"] = "*Final notifications for {} come back TODAY!*".format(deadline_text)
-            notifications.append((days, notif))
+        sent = digest.send_listing(digest.NOTIFICATIONS, lambda payload: message.send_webapi('', payload))
     except:
-        session.rollback()
         message.reply("Exception on query!")
-        error = True
         raise
-    finally:
-        if not error:
-            if notifications:
-                notifications.sort()
-                response = []
-                for days, notif in notifications:
-                    if days == 0:
-                        notif["color"] = "#ff0000"
-                    elif days < 7 and days > 0:
-                        notif["color"] = "#ffff00"
-                    response.append(notif)
-                message.send_webapi('', json.dumps(response))
-            else:
-                message.reply("No notification dates!")
-        session.close()
+    if not sent:
+        message.reply("No notification dates!")
+
+
+def parse_forget_deadline(tokens):
+    # forget (about)? conference
+    if not tokens.startswith(('forget',)):
+        return None
+    i = 2 if tokens.startswith(('about',), 1) and len(tokens) > 2 else 1
+    if not 0 < len(tokens) - i <= MAX_ITEM_WORDS:
+        return None
+    return (tokens.text(i),)
 
 
-@respond_to('^forget(\s+about)?\s+(.*)', re.IGNORECASE)
-def forget_deadline(message, _, match):
+@commands.command(parse_forget_deadline, precedence=10)
+def forget_deadline(message, match):
     session = db.Session()
     try:
-        q = query_for_item(match, session)
+        q = db.find_deadlines(session, match, with_response=True)
         if not q:
             message.reply("No matching deadlines")
         elif len(q) > 1:
@@ -463,11 +456,13 @@ def forget_deadline(message, _, match):
                                                                                  for x in q)))
         else:
             message.reply("Deleted deadline {}".format(q[0].item))
-            r = query_for_item(match, session, ResponseDeadline, ResponseDeadline.item)
-            if r:  # there should be only one because Deadline.item acts as a de facto foreign key constraint
-                session.delete(r[0])
+            deadline_id = q[0].id
+            response_id = q[0].response.id if q[0].response is not None else None
+            # Its response dates go with it
             session.delete(q[0])
             session.commit()
+            db.bump_data_version()
+            reminders.deadline_removed(deadline_id, response_id)
     except:
         session.rollback()
         raise
@@ -475,38 +470,194 @@ def forget_deadline(message, _, match):
         session.close()
 
 
-@respond_to('help?', re.IGNORECASE)
-def show_help(message):
-    attachments = []
-    attach = {"mrkdwn_in": ["text"]}
-    attach["text"] = "I can only understand the following language:\r\
-        \r\
-        - To add conference to the database: conference is on date \r\
-        - To remove conference from database: forget about conference \r\
-        - To add an abstract deadline: abstract for conference due by date \r\
-        - To record a deadline change: conference moved to date \r\
-        - To record an early notification date: early notification for conference is on date \r\
-        - To record a final notification date: (final)? notification for conference is on date \r\
-        - To clear an early notification date: clear early notification date for conference\r\
-        - To check notification dates for an individual conference: when does conference come back? \r\
-        - To check current deadlines: deadlines? \r\
-        - To check all notification dates: notification dates? \r\
-        \r\
-        *Note*: I am always listening for the word deadlines but you have to tag me for adding/removing. \r\
-        \r\
-        *Update*: I can tell you about notification dates now!"
-    attachments.append(attach)
-    message.send_webapi('', json.dumps(attachments))
-
-
-@respond_to('rollback?', re.IGNORECASE)
-def rollback_db(message):
-    attachments = []
+def parse_import(tokens):
+    # import (deadlines)?, with a CSV or iCalendar file attached
+    if not tokens.startswith(('import',)) or len(tokens) > 2:
+        return None
+    return ()
+
+
+@commands.command(parse_import, precedence=6)
+def import_deadlines(message):
+    file_info = bulk.uploaded_file(message)
+    if file_info is None:
+        message.reply("Attach a CSV or iCalendar file of deadlines to the import message")
+        return
+    try:
+        rows, errors = bulk.parse_file(file_info.get('name') or '',
+                                       bulk.download(file_info, settings.API_TOKEN))
+    except bulk.BulkImportError as e:
+        message.reply(str(e))
+        return
     session = db.Session()
-    session.rollback()
-    attach = {"mrkdwn_in": ["text"]}
-    attach["text"] = "session rolledback!"
-    attachments.append(attach)
-    message.send_webapi('', json.dumps(attachments))
-    session.close()
+    try:
+        deadlines, responses, row_errors = bulk.import_rows(session, rows, parse_and_verify_date)
+        session.commit()
+    except:
+        session.rollback()
+        message.reply("Encountered error when importing deadlines")
+        raise
+    finally:
+        session.close()
+    if deadlines:
+        db.bump_data_version()
+        for d in deadlines:
+            reminders.deadline_changed(d)
+        for r in responses:
+            reminders.response_changed(r)
+    errors = sorted(errors + row_errors)
+    metrics.inc('import_rows_total', len(deadlines), result='imported')
+    metrics.inc('import_rows_total', len(errors), result='skipped')
+    lines = ["Imported {} deadline{}".format(len(deadlines), '' if len(deadlines) == 1 else 's')]
+    if errors:
+        lines[0] += ", skipped {} row{}:".format(len(errors), '' if len(errors) == 1 else 's')
+        lines.extend("line {}: {}".format(line, error) for line, error in errors[:MAX_REPORTED_ERRORS])
+        if len(errors) > MAX_REPORTED_ERRORS:
+            lines.append("...and {} more".format(len(errors) - MAX_REPORTED_ERRORS))
+    chunked.reply_lines(message, lines)
+
+
+def parse_export(tokens):
+    # export (deadlines|calendar)?
+    if not tokens.startswith(('export',)) or len(tokens) > 2:
+        return None
+    return ()
+
+
+@commands.command(parse_export, precedence=8)
+def export_deadlines(message):
+    # The same cached calendar as the feed (see ics.get_calendar)
+    message.channel.upload_content('deadlines.ics', ics.get_calendar().body)
+
+
+def parse_archive_search(tokens):
+    # archive search conference
+    if not tokens.startswith(('archive', 'search')) or not 0 < len(tokens) - 2 <= MAX_ITEM_WORDS:
+        return None
+    return (tokens.text(2).rstrip('?'),)
+
+
+@commands.command(parse_archive_search, precedence=12)
+def search_archive(message, item):
+    session = db.Session()
+    try:
+        found = archive.search(session, item)
+    finally:
+        session.close()
+    if not found:
+        message.reply("Nothing in the archive matches {}".format(item))
+        return
+    chunked.reply_lines(message, [archive.describe(a) for a in found])
+
+
+LAST_YEAR_WORDS = ('year', 'years', "year's", "year’s")
+DATES_WORDS = ('date', 'dates', 'deadline', 'deadlines')
+
 
+def parse_last_year(tokens):
+    # last year's (dates|deadlines)? (for|of)? conference
+    if len(tokens) < 3 or tokens.words[0] != 'last' or tokens.words[1] not in LAST_YEAR_WORDS:
+        return None
+    i = 2
+    if tokens.words[i] in DATES_WORDS:
+        i += 1
+    if i < len(tokens) and tokens.words[i] in ('for', 'of'):
+        i += 1
+    if not 0 < len(tokens) - i <= MAX_ITEM_WORDS:
+        return None
+    return (tokens.text(i).rstrip('?'),)
+
+
+@commands.command(parse_last_year, precedence=15)
+def show_last_year(message, item):
+    session = db.Session()
+    try:
+        # A name without a year stands for the live conference it matches,
+        # so "CHI" with "CHI 2027" upcoming asks for CHI 2026
+        q = db.find_deadlines(session, item)
+        if len(q) == 1:
+            item = q[0].item
+        previous = archive.previous_meeting(session, item)
+    finally:
+        session.close()
+    if previous is None:
+        message.reply("I don't have last year's dates for {}".format(item))
+    else:
+        message.reply(archive.describe(previous))
+
+
+def parse_help(tokens):
+    return () if contains_word(tokens, lambda word: word == 'help') else None
+
+
+HELP_LINES = (
+    "I can only understand the following language:",
+    "",
+    "- To add conference to the database: conference is on date",
+    "- To remove conference from database: forget about conference",
+    "- To add an abstract deadline: abstract for conference due by date",
+    "- To record a deadline change: conference moved to date",
+    "- To record an early notification date: early notification for conference is on date",
+    "- To record a final notification date: (final)? notification for conference is on date",
+    "- To clear an early notification date: clear early notification date for conference",
+    "- To check notification dates for an individual conference: when does conference come back?",
+    "- To check current deadlines: deadlines?",
+    "- To check all notification dates: notification dates?",
+    "- To add many conferences at once: import, with a CSV (conference, deadline, abstract, "
+    "early notification, notification) or iCalendar file attached",
+    "- To get the upcoming dates as a calendar file: export",
+    "- To look up past conferences: archive search conference",
+    "- To see the previous meeting's dates: last year's dates for conference",
+    "- To see how the bot is performing: stats",
+    "",
+    "*Note*: I am always listening for the word deadlines but you have to tag me for adding/removing.",
+    "",
+    "*Update*: I can tell you about notification dates now!",
+)
+
+
+@commands.command(parse_help, precedence=100)
+def show_help(message):
+    chunked.send_attachments(message, ({"mrkdwn_in": ["text"], "text": text}
+                                       for text in chunked.text_chunks(HELP_LINES)))
+
+
+def parse_stats(tokens):
+    return () if tokens.words == ['stats'] else None
+
+
+@commands.command(parse_stats, precedence=5)
+def show_stats(message):
+    lines = ['workers: ' + ', '.join('{} {}'.format(key, round(value, 3) if isinstance(value, float) else value)
+                                     for key, value in sorted(workers.pool.stats().items())),
+             'listing cache: ' + ', '.join('{} {}'.format(key, round(value, 3) if isinstance(value, float) else value)
+                                           for key, value in sorted(digest.cache_stats().items())),
+             'date cache: {}'.format(dates.cache_info()),
+             'database pool: {}'.format(db.pool_status())]
+    lines.extend(metrics.summary())
+    # Each message its own code block
+    for text in chunked.text_chunks(lines, chunked.MAX_TEXT - len("```\n\n```")):
+        message.reply("```\n{}\n```".format(text))
+
+
+def handled_by_other_plugin(text):
+    # Whether a plugin other than this one (hello, latex) will answer
+    for matcher, func in PluginsManager.commands['respond_to'].items():
+        if func is not route_command and matcher.search(text):
+            return True
+    return False
+
+
+# Every message addressed to the bot goes through the command router, which
+# splits it into words once and runs exactly one command, the first by
+# precedence that accepts it. With a regex per command, slackbot ran every
+# handler whose pattern matched, so one message could trigger several. The
+# command itself runs on the worker pool, so a slow database or WikiCFP
+# doesn't hold up the dispatcher.
+@respond_to(r'(?s)(.*)')
+def route_command(message, text):
+    handler, args = commands.match(text)
+    if handler is not None:
+        workers.run(message, handler, *args)
+    elif not handled_by_other_plugin(text):
+        message.reply("Sorry, I didn't understand that. Ask me for help to see what I can do.")
@@ -0,0 +1,293 @@
+# coding=utf-8
+import datetime
+import logging
+import os
+import threading
+from collections import namedtuple
+
+import schedule
+
+import archive
+import chunked
+import db
+import wikicfp_index
+
+logger = logging.getLogger(__name__)
+
+DEADLINES, NOTIFICATIONS = 'deadlines', 'notifications'
+
+# Seconds the background thread sleeps between checks for scheduled jobs
+POLL_INTERVAL = 30
+
+# Optionally only list dates within LISTING_HORIZON_DAYS days, and at most
+# LISTING_LIMIT rows from each table
+HORIZON = int(os.environ['LISTING_HORIZON_DAYS']) if os.environ.get('LISTING_HORIZON_DAYS') else None
+LIMIT = int(os.environ['LISTING_LIMIT']) if os.environ.get('LISTING_LIMIT') else None
+
+# Snapshot of the rendered listings: `payloads` maps DEADLINES and
+# NOTIFICATIONS to a tuple of attachments JSON payloads, one per Slack
+# message (see chunked), which is empty when there is nothing to list
+Snapshot = namedtuple('Snapshot', ['version', 'date', 'payloads'])
+
+# A snapshot built at an older data version than the database's is never
+# served
+_snapshot = None
+_snapshot_lock = threading.Lock()
+# Held while building, so that requests arriving during a rebuild wait for
+# it instead of each starting their own
+_rebuild_lock = threading.Lock()
+# Listing requests served from the snapshot, and those that had to wait for
+# a rebuild; `rebuilds` also counts the background thread's
+_counters = {'hits': 0, 'misses': 0, 'rebuilds': 0}
+_counters_lock = threading.Lock()
+_dirty = threading.Event()
+_scheduler = schedule.Scheduler()
+_thread = None
+
+
+def format_conf_link(conf_name, cfp_urls):
+    # Link the conference name to its WikiCFP page if the lookup resolved
+    if conf_name not in cfp_urls:
+        return conf_name
+    return '<{cfp_url}|{conf_name}>'.format(cfp_url=cfp_urls[conf_name],
+                                             conf_name=conf_name)
+
+
+def _batches(rows):
+    # Slices of `rows` that start at one message's worth and double, so the
+    # first message is ready after one small WikiCFP lookup and the whole
+    # listing still takes only a logarithmic number of them
+    start, size = 0, chunked.MAX_ATTACHMENTS
+    while start < len(rows):
+        yield rows[start:start + size]
+        start += size
+        size *= 2
+
+
+def build_deadline_attachments(session, today):
+    # Generates the attachments soonest first, as they are built
+    upcoming = db.upcoming_deadlines(session, today, HORIZON, LIMIT)
+    for batch in _batches(upcoming):
+        cfp_urls = wikicfp_index.lookup_urls(session, ((d.item, d.date) for d in batch))
+        for deadline in batch:
+            yield _deadline_attachment(deadline, today, cfp_urls)
+
+
+def _deadline_attachment(deadline, today, cfp_urls):
+    days = (deadline.date - today).days
+    attach = {"mrkdwn_in": ["text"]}
+    deadline_text = format_conf_link(deadline.item, cfp_urls)
+    if days > 1:
+        abstract_message = ""
+        if deadline.abstract_date != None:
+            abstract_days = (deadline.abstract_date - today).days
+            if abstract_days < 0:
+                abstract_message = ""
+            elif abstract_days == 0:
+                abstract_message = " (*abstract due TODAY!*)"
+            elif abstract_days == 1:
+                abstract_message = " (abstract due tomorrow)"
+            else:
+                abstract_message = " (abstract due in {} days)".format(
+                    abstract_days)
+        attach["text"] = "{} days until {}{}".format(days, deadline_text,
+                                                     abstract_message)
+    elif days == 1:
+        attach["text"] = "*{} tomorrow!*".format(deadline_text)
+    else:
+        attach["text"] = "*{} TODAY!*".format(deadline_text)
+        attach["color"] = "#ff0000"
+    if days < 7 and days > 0:
+        attach["color"] = "#ffff00"
+    return attach
+
+
+def _listable(days):
+    return days >= 0 and (HORIZON is None or days <= HORIZON)
+
+
+def build_notification_attachments(session, today):
+    # Generates the attachments soonest first. Early and final notifications
+    # interleave, so the dates are all sorted before the first is yielded;
+    # the links are still looked up and the text built batch by batch.
+    notifications = []
+    for deadline in db.upcoming_responses(session, today, HORIZON, LIMIT):
+        # The query only checks a row's next date against the horizon, so
+        # each date is checked here. Early notifications:
+        if deadline.early_response_date != None:
+            early_notification_days = (deadline.early_response_date - today).days
+            if _listable(early_notification_days):
+                notifications.append((early_notification_days, True, deadline))
+
+        # Final notifications
+        if deadline.notification_date is None:
+            continue
+        days = (deadline.notification_date - today).days
+        if _listable(days):
+            notifications.append((days, False, deadline))
+
+    # Sort on the day count only; the rows after it needn't be orderable
+    notifications.sort(key=lambda notification: notification[0])
+    for batch in _batches(notifications):
+        cfp_urls = wikicfp_index.lookup_urls(
+            session, ((r.item, r.notification_date or r.early_response_date) for _, _, r in batch))
+        for days, early, deadline in batch:
+            yield _notification_attachment(days, early, format_conf_link(deadline.item, cfp_urls))
+
+
+def _notification_attachment(days, early, deadline_text):
+    notif = {"mrkdwn_in": ["text"]}
+    if early:
+        if days == 0:
+            notif["text"] = "*Early notifications for {} come back TODAY!*".format(deadline_text)
+        elif days == 1:
+            notif["text"] = "Early notifications for {} come back tomorrow".format(deadline_text)
+        else:
+            notif["text"] = "Early notifications for {} come back in {} days".format(deadline_text, days)
+    elif days > 1:
+        notif["text"] = "Final notifications for {} come back in {} days".format(deadline_text, days)
+    elif days == 1:
+        notif["text"] = "*Final notifications for {} come back tomorrow!*".format(deadline_text)
+    else:
+        notif["text"] = "*Final notifications for {} come back TODAY!*".format(deadline_text)
+    if days == 0:
+        notif["color"] = "#ff0000"
+    elif days < 7 and days > 0:
+        notif["color"] = "#ffff00"
+    return notif
+
+
+BUILDERS = {DEADLINES: build_deadline_attachments, NOTIFICATIONS: build_notification_attachments}
+
+
+def _count(counter):
+    with _counters_lock:
+        _counters[counter] += 1
+
+
+def cache_stats():
+    with _counters_lock:
+        stats = dict(_counters)
+    requests = stats['hits'] + stats['misses']
+    stats['hit_rate'] = stats['hits'] / requests if requests else 0.0
+    return stats
+
+
+def _is_current(snapshot):
+    return (snapshot is not None and snapshot.version == db.data_version() and
+            snapshot.date == datetime.date.today())
+
+
+def rebuild():
+    with _rebuild_lock:
+        return _rebuild()
+
+
+def _rebuild(first=None, send=None):
+    # Build both listings and store them as the snapshot. The listing `first`
+    # is built first, and each of its payloads is passed to `send` as soon as
+    # it is full, so a request that has to wait for a rebuild sees the most
+    # urgent dates without waiting for the rest.
+    global _snapshot
+    # Read the version before querying: if a write lands while we build, the
+    # snapshot is stored under the old version and the next read rebuilds
+    version = db.data_version()
+    today = datetime.date.today()
+    _count('rebuilds')
+    names = sorted(BUILDERS, key=lambda name: name != first)
+    session = db.Session()
+    try:
+        payloads = dict()
+        for name in names:
+            built = []
+            for payload in chunked.attachment_chunks(BUILDERS[name](session, today)):
+                built.append(payload)
+                if name == first and send is not None:
+                    send(payload)
+            payloads[name] = tuple(built)
+    except:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+    snapshot = Snapshot(version, today, payloads)
+    with _snapshot_lock:
+        if _snapshot is None or _snapshot.version <= version:
+            _snapshot = snapshot
+    return snapshot
+
+
+def send_listing(name, send):
+    # Pass each attachments JSON payload of a listing to `send`, returning
+    # how many there were (none if the listing is empty). Served from the
+    # snapshot when it is current for today's date and the latest write;
+    # otherwise rebuilt on the spot, sending as it goes.
+    snapshot = _snapshot
+    if _is_current(snapshot):
+        _count('hits')
+    else:
+        _count('misses')
+        with _rebuild_lock:
+            # Someone else may have rebuilt it while we waited
+            snapshot = _snapshot
+            if not _is_current(snapshot):
+                return len(_rebuild(name, send).payloads[name])
+    for payload in snapshot.payloads[name]:
+        send(payload)
+    return len(snapshot.payloads[name])
+
+
+def _refresh():
+    try:
+        rebuild()
+    except:
+        logger.exception('Failed to rebuild deadline digest')
+
+
+def _refresh_index():
+    # Runs after every rebuild; it only goes to WikiCFP for conferences the
+    # index doesn't cover yet, and if it adds any, the data version bump
+    # triggers another rebuild with their links
+    try:
+        wikicfp_index.refresh()
+    except:
+        logger.exception('Failed to refresh WikiCFP index')
+
+
+def _compact():
+    # Archiving past deadlines bumps the data version, so the listings and
+    # item index catch up on their own
+    try:
+        archive.compact()
+    except:
+        logger.exception('Failed to archive past deadlines')
+
+
+def _run():
+    _refresh()
+    _refresh_index()
+    _compact()
+    while True:
+        if _dirty.wait(POLL_INTERVAL):
+            _dirty.clear()
+            _refresh()
+            _refresh_index()
+        _scheduler.run_pending()
+
+
+def start():
+    # Start the background thread that keeps the digest warm: it builds the
+    # listings now, again at local midnight when the day counts change, and
+    # after every write (see db.bump_data_version). It also archives past
+    # deadlines, at startup and nightly.
+    global _thread
+    if _thread is not None:
+        return
+    _scheduler.every().day.at("00:00").do(_refresh)
+    _scheduler.every().day.at("02:00").do(_compact)
+    # Retry series that weren't on WikiCFP yet
+    _scheduler.every().day.at("03:00").do(_refresh_index)
+    db.add_change_listener(_dirty.set)
+    _thread = threading.Thread(target=_run, name='digest')
+    _thread.daemon = True
+    _thread.start()
@@ -0,0 +1,208 @@
+# coding=utf-8
+# iCalendar (RFC 5545) reading and writing for deadlines, and a calendar feed
+# of the upcoming dates. The feed is rendered once per data version and day,
+# like the listings, and can be served over HTTP with an ETag so that
+# calendar clients polling it mostly get 304s.
+import datetime
+import hashlib
+import logging
+import os
+import re
+import threading
+from collections import namedtuple
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn
+
+import db
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Serve the feed at http://<host>:ICS_FEED_PORT/deadlines.ics; off if unset
+FEED_PORT = int(os.environ['ICS_FEED_PORT']) if os.environ.get('ICS_FEED_PORT') else None
+FEED_PATH = '/deadlines.ics'
+# Seconds calendar clients are told they may cache the feed for
+FEED_MAX_AGE = 300
+
+# What each kind of date is called in event summaries, which is also how
+# imported events are recognized
+DEADLINE, ABSTRACT, EARLY, FINAL = 'deadline', 'abstract', 'early notification', 'notification'
+SUMMARY_SUFFIXES = (EARLY, FINAL, ABSTRACT, DEADLINE)
+
+# An event read from a calendar: `kind` is one of the above
+Event = namedtuple('Event', ['line', 'item', 'kind', 'date'])
+
+Calendar = namedtuple('Calendar', ['version', 'date', 'body', 'etag'])
+
+
+def _escape(text):
+    return (text.replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\n', '\\n'))
+
+
+def _unescape(text):
+    return re.sub(r'\\([\\;,nN])', lambda m: '\n' if m.group(1) in 'nN' else m.group(1), text)
+
+
+def _fold(line):
+    # Lines longer than 75 octets continue on the next line after a space
+    folded = []
+    encoded = line.encode('utf-8')
+    while len(encoded) > 75:
+        cut = 75
+        while cut and (encoded[cut] & 0xC0) == 0x80:  # don't split a character
+            cut -= 1
+        folded.append(encoded[:cut].decode('utf-8'))
+        encoded = b' ' + encoded[cut:]
+    folded.append(encoded.decode('utf-8'))
+    return '\r\n'.join(folded)
+
+
+def _event(uid, item, kind, date, stamp):
+    return [
+        'BEGIN:VEVENT',
+        'UID:{}@performbot'.format(uid),
+        'DTSTAMP:{}'.format(stamp),
+        'DTSTART;VALUE=DATE:{}'.format(date.strftime('%Y%m%d')),
+        'DTEND;VALUE=DATE:{}'.format((date + datetime.timedelta(days=1)).strftime('%Y%m%d')),
+        'SUMMARY:{}'.format(_escape('{} {}'.format(item, kind))),
+        'TRANSP:TRANSPARENT',
+        'END:VEVENT',
+    ]
+
+
+def render(session, today):
+    # The upcoming deadlines, abstract deadlines and notification dates as an
+    # iCalendar document
+    stamp = datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
+    lines = ['BEGIN:VCALENDAR', 'VERSION:2.0', 'PRODID:-//performbot//deadlines//EN',
+             'CALSCALE:GREGORIAN', 'X-WR-CALNAME:Deadlines']
+    for d in db.upcoming_deadlines(session, today):
+        lines.extend(_event('deadline-{}'.format(d.id), d.item, DEADLINE, d.date, stamp))
+        if d.abstract_date is not None and d.abstract_date >= today:
+            lines.extend(_event('abstract-{}'.format(d.id), d.item, ABSTRACT, d.abstract_date, stamp))
+    for r in db.upcoming_responses(session, today):
+        if r.early_response_date is not None and r.early_response_date >= today:
+            lines.extend(_event('early-{}'.format(r.id), r.item, EARLY, r.early_response_date, stamp))
+        if r.notification_date is not None and r.notification_date >= today:
+            lines.extend(_event('notification-{}'.format(r.id), r.item, FINAL, r.notification_date, stamp))
+    lines.append('END:VCALENDAR')
+    return '\r\n'.join(_fold(line) for line in lines) + '\r\n'
+
+
+def _unfolded_lines(text):
+    # (line number, content line) with continuation lines joined on
+    lines = []
+    for number, line in enumerate(text.splitlines(), 1):
+        if line[:1] in (' ', '\t') and lines:
+            lines[-1] = (lines[-1][0], lines[-1][1] + line[1:])
+        elif line:
+            lines.append((number, line))
+    return lines
+
+
+def _parse_date(value):
+    # A DATE (20270503) or DATE-TIME (20270503T235900Z); only the day counts
+    return datetime.datetime.strptime(value[:8], '%Y%m%d').date()
+
+
+def parse(text):
+    # Read the VEVENTs from an iCalendar document, returning (events, errors):
+    # Events for those with a summary and a start date, and (line, message)
+    # for those without. A summary ending in one of SUMMARY_SUFFIXES (as in
+    # the exported feed) says which date the event is; any other is taken to
+    # be a submission deadline.
+    events, errors = [], []
+    event = None
+    for number, line in _unfolded_lines(text):
+        name, _, value = line.partition(':')
+        name = name.split(';')[0].upper()
+        if name == 'BEGIN' and value.upper() == 'VEVENT':
+            event = {'line': number}
+        elif event is None:
+            continue
+        elif name == 'SUMMARY':
+            event['summary'] = ' '.join(_unescape(value).split())
+        elif name == 'DTSTART':
+            try:
+                event['date'] = _parse_date(value.strip())
+            except ValueError:
+                event['error'] = "Can't parse date {}".format(value)
+        elif name == 'END' and value.upper() == 'VEVENT':
+            if 'error' in event:
+                errors.append((event['line'], event['error']))
+            elif not event.get('summary') or 'date' not in event:
+                errors.append((event['line'], "Event has no summary or start date"))
+            else:
+                item, kind = event['summary'], DEADLINE
+                for suffix in SUMMARY_SUFFIXES:
+                    if item.lower().endswith(' ' + suffix):
+                        item, kind = item[:-len(suffix) - 1].strip(), suffix
+                        break
+                events.append(Event(event['line'], item, kind, event['date']))
+            event = None
+    return events, errors
+
+
+_calendar = None
+_calendar_lock = threading.Lock()
+
+
+def get_calendar():
+    # The feed for today and the current data version, rendered only when
+    # either has changed since it was last asked for
+    global _calendar
+    version, today = db.data_version(), datetime.date.today()
+    with _calendar_lock:
+        calendar = _calendar
+        if calendar is not None and calendar.version == version and calendar.date == today:
+            metrics.inc('ics_cache_total', result='hit')
+            return calendar
+        metrics.inc('ics_cache_total', result='miss')
+        session = db.Session()
+        try:
+            body = render(session, today)
+        finally:
+            session.close()
+        etag = '"{}"'.format(hashlib.sha1(body.encode('utf-8')).hexdigest())
+        _calendar = Calendar(version, today, body, etag)
+        return _calendar
+
+
+class _FeedHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?')[0] != FEED_PATH:
+            self.send_error(404)
+            return
+        calendar = get_calendar()
+        if self.headers.get('If-None-Match') == calendar.etag:
+            self.send_response(304)
+            self.send_header('ETag', calendar.etag)
+            self.end_headers()
+            return
+        body = calendar.body.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/calendar; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', calendar.etag)
+        self.send_header('Cache-Control', 'max-age={}'.format(FEED_MAX_AGE))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+class _FeedServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def start_feed(port=FEED_PORT):
+    # Serve the feed on a background thread, if a port is configured
+    if port is None:
+        return None
+    server = _FeedServer(('', port), _FeedHandler)
+    thread = threading.Thread(target=server.serve_forever, name='ics-feed')
+    thread.daemon = True
+    thread.start()
+    return server
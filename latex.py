@@ -1,13 +1,20 @@
-from urllib.parse import quote
 from html import unescape
 from slackbot.bot import listen_to, respond_to
-import json
+
+import mathrender
+import metrics
+import workers
 
 @listen_to(r'^\$(.*)\$$')
 @respond_to(r'^\$(.*)\$$')
+@workers.queued
 def render_latex(message, latex):
-    # based on https://github.com/nicolewhite/SlackTeX/blob/master/slacktex/views.py
-    latex_url = "http://chart.apis.google.com/chart?cht=tx&chl={latex}".format(
-        latex=quote(unescape(latex)))
-    message.send_webapi('', json.dumps([{"image_url": latex_url,
-        "fallback": "Latex rendering fail?"}]))
+    # Rendered locally (see mathrender) and uploaded, since Slack can only
+    # show images from a public URL; repeated formulas come from the cache
+    try:
+        path = mathrender.render(unescape(latex))
+    except mathrender.RenderError as e:
+        metrics.inc('latex_errors_total')
+        message.reply("Couldn't render that: {}".format(e))
+        return
+    message.channel.upload_file('formula.png', path)
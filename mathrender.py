@@ -0,0 +1,154 @@
+# coding=utf-8
+# Renders LaTeX math to PNG with matplotlib's mathtext, in separate processes
+# so a pathological formula can be killed, and keeps the images in an on-disk
+# cache addressed by a hash of the formula. Nothing here imports matplotlib in
+# the bot's own process.
+import hashlib
+import logging
+import multiprocessing
+import os
+import tempfile
+import threading
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.environ.get('LATEX_CACHE_DIR') or os.path.join(tempfile.gettempdir(), 'performbot-latex')
+# Total size of the cached images, beyond which the least recently used are
+# deleted
+CACHE_BYTES = int(os.environ.get('LATEX_CACHE_MB', '50')) * 1024 * 1024
+# Seconds a formula may take to render before its process is killed
+RENDER_TIMEOUT = 10
+RENDER_PROCESSES = 2
+DPI = 200
+
+
+class RenderError(Exception):
+    pass
+
+
+def normalize(latex):
+    # Collapse whitespace, which TeX ignores in math mode anyway, so that
+    # formulas typed slightly differently share a cache entry
+    return ' '.join(latex.split())
+
+
+def cache_key(latex):
+    return hashlib.sha256(normalize(latex).encode('utf-8')).hexdigest()
+
+
+class DiskCache(object):
+    # PNG files named by cache key in one directory. A file's modification
+    # time is its last use, so eviction is least recently used; the total
+    # size is tracked in memory after one scan of the directory.
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._size = None
+        self._lock = threading.Lock()
+
+    def path(self, key):
+        return os.path.join(self.directory, key + '.png')
+
+    def get(self, key):
+        # The image's path, marked as just used, or None
+        path = self.path(key)
+        try:
+            os.utime(path, None)
+        except OSError:
+            return None
+        return path
+
+    def added(self, key):
+        # Account for an image just written to path(key), evicting old ones
+        # if the cache is over its size
+        with self._lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
+            else:
+                self._size += os.path.getsize(self.path(key))
+            if self._size > self.max_bytes:
+                self._evict(keep=self.path(key))
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return entries
+
+    def _evict(self, keep):
+        for mtime, size, path in sorted(self._entries()):
+            if self._size <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            self._size -= size
+
+
+def _render_file(latex, path):
+    # Runs in a render process
+    from matplotlib import mathtext
+    tmp = '{}.{}.tmp'.format(path, os.getpid())
+    mathtext.math_to_image('${}$'.format(latex), tmp, dpi=DPI, format='png')
+    os.replace(tmp, path)
+
+
+_cache = DiskCache(CACHE_DIR, CACHE_BYTES)
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # Fresh interpreters rather than forks of the threaded bot
+            context = multiprocessing.get_context('forkserver')
+            _pool = context.Pool(RENDER_PROCESSES)
+        return _pool
+
+
+def _kill_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.terminate()
+
+
+def render(latex):
+    # Path to a PNG of the formula, rendering it unless it's cached. Raises
+    # RenderError if the formula doesn't parse or takes longer than
+    # RENDER_TIMEOUT, in which case the render processes are replaced.
+    latex = normalize(latex)
+    key = cache_key(latex)
+    path = _cache.get(key)
+    if path is not None:
+        metrics.inc('latex_cache_total', result='hit')
+        return path
+    metrics.inc('latex_cache_total', result='miss')
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = _cache.path(key)
+    pool = _get_pool()
+    result = pool.apply_async(_render_file, (latex, path))
+    try:
+        with metrics.timed('latex_render_seconds'):
+            result.get(RENDER_TIMEOUT)
+    except multiprocessing.TimeoutError:
+        logger.warning('Rendering %r took over %ss', latex, RENDER_TIMEOUT)
+        _kill_pool(pool)
+        raise RenderError('took too long to render')
+    except Exception as e:
+        raise RenderError(str(e).strip().splitlines()[-1] if str(e).strip() else 'failed to render')
+    _cache.added(key)
+    return path
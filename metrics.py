@@ -0,0 +1,211 @@
+# coding=utf-8
+# In-process counters and latency histograms, cheap enough to leave on: a
+# lock and a bisect per observation. Read them with the "stats" command, or
+# set METRICS_FILE to have them written in Prometheus' text format every
+# METRICS_INTERVAL seconds (for node_exporter's textfile collector).
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+METRICS_FILE = os.environ.get('METRICS_FILE')
+METRICS_INTERVAL = int(os.environ.get('METRICS_INTERVAL', '60'))
+
+# Upper bounds, in seconds, of the latency histogram buckets
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, float('inf'))
+
+
+class Histogram(object):
+    __slots__ = ('counts', 'sum', 'count')
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def percentile(self, pct):
+        # Upper bound of the bucket holding the pct'th percentile
+        if not self.count:
+            return 0.0
+        rank = pct / 100.0 * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return BUCKETS[-1]
+
+
+_lock = threading.Lock()
+# (name, labels) -> value or Histogram, where labels is a sorted tuple of
+# (label, value) pairs
+_counters = dict()
+_histograms = dict()
+
+# The command the current thread is running, so that SQL can be charged to it
+_local = threading.local()
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, amount=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + amount
+
+
+def observe(name, seconds, **labels):
+    key = _key(name, labels)
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = Histogram()
+        histogram.observe(seconds)
+
+
+@contextmanager
+def timed(name, **labels):
+    start = time.time()
+    try:
+        yield
+    finally:
+        observe(name, time.time() - start, **labels)
+
+
+def current_command():
+    return getattr(_local, 'command', None)
+
+
+@contextmanager
+def command(name):
+    # Count and time running the command `name` on this thread, which SQL
+    # metrics are labelled with meanwhile
+    previous = current_command()
+    _local.command = name
+    start = time.time()
+    try:
+        yield
+    except Exception:
+        inc('command_errors_total', command=name)
+        raise
+    finally:
+        _local.command = previous
+        observe('command_seconds', time.time() - start, command=name)
+
+
+def counters():
+    with _lock:
+        return dict(_counters)
+
+
+def histograms():
+    # Copies, so callers can read them without the lock
+    with _lock:
+        copies = dict()
+        for key, histogram in _histograms.items():
+            copy = Histogram()
+            copy.counts = list(histogram.counts)
+            copy.sum = histogram.sum
+            copy.count = histogram.count
+            copies[key] = copy
+        return copies
+
+
+def _format_seconds(seconds):
+    if seconds == float('inf'):
+        return 'inf'
+    return '{:.1f}ms'.format(seconds * 1000)
+
+
+def summary():
+    # Human-readable lines for the "stats" command: every histogram with its
+    # count, mean and (bucket-rounded) percentiles, and every counter, with
+    # its share of the total for counters split by result
+    lines = []
+    for (name, labels), histogram in sorted(histograms().items(), key=lambda item: item[0]):
+        lines.append('{}{}: n={} mean={} p50<={} p95<={} p99<={}'.format(
+            name, _labels_text(labels), histogram.count,
+            _format_seconds(histogram.sum / histogram.count if histogram.count else 0),
+            _format_seconds(histogram.percentile(50)), _format_seconds(histogram.percentile(95)),
+            _format_seconds(histogram.percentile(99))))
+    all_counters = counters()
+    totals = dict()
+    for (name, labels), value in all_counters.items():
+        if 'result' in dict(labels):
+            totals[name] = totals.get(name, 0) + value
+    for (name, labels), value in sorted(all_counters.items()):
+        line = '{}{}: {}'.format(name, _labels_text(labels), value)
+        if totals.get(name):
+            line += ' ({:.0%})'.format(value / float(totals[name]))
+        lines.append(line)
+    return lines
+
+
+def _labels_text(labels, extra=()):
+    labels = tuple(labels) + tuple(extra)
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(label, str(value).replace('\\', '\\\\').replace('"', '\\"'))
+                          for label, value in labels) + '}'
+
+
+def prometheus_text():
+    lines = []
+    typed = set()
+    for (name, labels), value in sorted(counters().items()):
+        if name not in typed:
+            lines.append('# TYPE performbot_{} counter'.format(name))
+            typed.add(name)
+        lines.append('performbot_{}{} {}'.format(name, _labels_text(labels), value))
+    for (name, labels), histogram in sorted(histograms().items(), key=lambda item: item[0]):
+        if name not in typed:
+            lines.append('# TYPE performbot_{} histogram'.format(name))
+            typed.add(name)
+        cumulative = 0
+        for bound, count in zip(BUCKETS, histogram.counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append('performbot_{}_bucket{} {}'.format(name, _labels_text(labels, [('le', le)]), cumulative))
+        lines.append('performbot_{}_sum{} {}'.format(name, _labels_text(labels), histogram.sum))
+        lines.append('performbot_{}_count{} {}'.format(name, _labels_text(labels), histogram.count))
+    return '\n'.join(lines) + '\n'
+
+
+def write_file(path):
+    # Written to a temporary file and renamed, so readers never see half
+    tmp = path + '.tmp'
+    with open(tmp, 'w') as f:
+        f.write(prometheus_text())
+    os.replace(tmp, path)
+
+
+_thread = None
+
+
+def start():
+    # Write METRICS_FILE every METRICS_INTERVAL seconds, if it is set
+    global _thread
+    if not METRICS_FILE or _thread is not None:
+        return
+
+    def run():
+        while True:
+            try:
+                write_file(METRICS_FILE)
+            except Exception:
+                logger.exception('Failed to write %s', METRICS_FILE)
+            time.sleep(METRICS_INTERVAL)
+    _thread = threading.Thread(target=run, name='metrics')
+    _thread.daemon = True
+    _thread.start()
@@ -1,5 +1,65 @@
-from slackbot.bot import Bot
+import startup  # first, so the startup clock covers everything below
+
+import importlib
+import logging
+import os
+
+# Each import is timed, so the startup report shows where the time goes. A
+# module shared by several of these is counted under the first to import it:
+# SQLAlchemy and metrics under db; schedule, the WikiCFP index and archive
+# under digest.
+with startup.timed('import slackbot'):
+    from slackbot import settings
+    from slackbot.bot import Bot
+
+with startup.timed('import db'):
+    import db
+with startup.timed('import digest'):
+    import digest
+with startup.timed('import ics'):
+    import ics
+with startup.timed('import metrics'):
+    import metrics
+with startup.timed('import reminders'):
+    import reminders
+
+# Import the slow dependencies and connect to the database in the background
+# once the bot is online; set WARM_UP=0 to leave it to the first command
+WARM_UP = os.environ.get('WARM_UP', '1') != '0'
+WARM_UP_TASKS = [
+    ('dateparser', lambda: importlib.import_module('dateparser')),
+    ('requests', lambda: importlib.import_module('requests')),
+    ('database', lambda: db.get_engine().connect().close()),
+]
+
+
+def import_plugins():
+    # Import the plugins ourselves, before slackbot does, so each one's cost
+    # shows up in the startup report
+    for plugin in settings.PLUGINS:
+        try:
+            with startup.timed('import ' + plugin):
+                importlib.import_module(plugin)
+        except Exception:
+            logging.getLogger(__name__).exception('Failed to import %s', plugin)
+
 
 if __name__ == "__main__":
-    bot = Bot()
+    import_plugins()
+    with startup.timed('connect to Slack'):
+        bot = Bot()
+    startup.mark('time to first websocket connect')
+    if WARM_UP:
+        startup.warm_up(WARM_UP_TASKS)
+    else:
+        startup.report()
+    # Build the deadline listings in the background so the first request
+    # doesn't pay for them
+    digest.start()
+    metrics.start()
+    ics.start_feed()
+    if reminders.CHANNEL:
+        client = bot._client
+        channel = client.find_channel_by_name(reminders.CHANNEL) or reminders.CHANNEL
+        reminders.start(lambda text: client.send_message(channel, text))
     bot.run()
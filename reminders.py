@@ -0,0 +1,244 @@
+# coding=utf-8
+# Posts reminders to a channel a week, a day and on the day of every upcoming
+# deadline, abstract deadline and notification date. Reminders wait in a heap
+# ordered by when they are due, and the scheduler thread sleeps until the
+# first of them; the command handlers update the heap as they change dates.
+import datetime
+import heapq
+import itertools
+import logging
+import os
+import threading
+
+from sqlalchemy import or_
+
+import db
+from db import Deadline, ResponseDeadline
+
+logger = logging.getLogger(__name__)
+
+# Channel (name or ID) the reminders are posted to; no reminders without one
+CHANNEL = os.environ.get('REMINDER_CHANNEL')
+# Local time of day reminders go out, as HH:MM
+TIME = datetime.datetime.strptime(os.environ.get('REMINDER_TIME', '09:00'), '%H:%M').time()
+# Days before a date to remind about it
+OFFSETS = (7, 1, 0)
+# Longest the scheduler sleeps without checking the clock, in case it jumps
+MAX_SLEEP = 3600
+
+DEADLINE, ABSTRACT, EARLY, FINAL = 'deadline', 'abstract', 'early', 'final'
+
+_MESSAGES = {
+    DEADLINE: ("{item} deadline is in {days} days ({date})",
+               "*{item} deadline is tomorrow!*",
+               "*{item} deadline is TODAY!*"),
+    ABSTRACT: ("Abstract for {item} is due in {days} days ({date})",
+               "*Abstract for {item} is due tomorrow!*",
+               "*Abstract for {item} is due TODAY!*"),
+    EARLY: ("Early notifications for {item} come back in {days} days ({date})",
+            "Early notifications for {item} come back tomorrow",
+            "*Early notifications for {item} come back TODAY!*"),
+    FINAL: ("Final notifications for {item} come back in {days} days ({date})",
+            "*Final notifications for {item} come back tomorrow!*",
+            "*Final notifications for {item} come back TODAY!*"),
+}
+
+
+def format_reminder(kind, item, date, days):
+    template = _MESSAGES[kind][2 if days == 0 else 1 if days == 1 else 0]
+    return template.format(item=item, days=days, date=date.strftime("%b %d"))
+
+
+class Clock(object):
+    def now(self):
+        return datetime.datetime.now()
+
+    def wait(self, wakeup, seconds):
+        # Sleep for `seconds` (forever if None) or until `wakeup` is set;
+        # returns whether it was set
+        return wakeup.wait(seconds)
+
+
+class SimulatedClock(object):
+    # A clock for simulations: time stands still except when the scheduler
+    # waits, when it jumps straight to the end of the wait
+    def __init__(self, start):
+        self._now = start
+
+    def now(self):
+        return self._now
+
+    def wait(self, wakeup, seconds):
+        if wakeup.is_set():
+            return True
+        if seconds is None:
+            raise RuntimeError("Nothing left to wait for")
+        self._now += datetime.timedelta(seconds=seconds)
+        return False
+
+
+class ReminderScheduler(object):
+    # `post` is called with the text of each reminder as it comes due. Each
+    # date is tracked under a key, (kind, row id); changing a key's date
+    # leaves its old reminders in the heap, but they are skipped when they
+    # come up because the key's generation has moved on.
+    def __init__(self, post, clock=None, offsets=OFFSETS, at=TIME):
+        self.post = post
+        self.clock = clock or Clock()
+        self.offsets = offsets
+        self.at = at
+        self.posted = 0
+        self._heap = []
+        # key -> (item, date, generation)
+        self._dates = dict()
+        self._generations = itertools.count()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+
+    def _reminders(self, key, item, date, generation, now):
+        for days in self.offsets:
+            due = datetime.datetime.combine(date - datetime.timedelta(days=days), self.at)
+            if due >= now:
+                yield (due, generation, key, days)
+
+    def load(self, dates):
+        # Replace everything with (key, item, date) triples, in one heapify
+        now = self.clock.now()
+        with self._lock:
+            self._dates = dict()
+            self._heap = []
+            for key, item, date in dates:
+                generation = next(self._generations)
+                self._dates[key] = (item, date, generation)
+                self._heap.extend(self._reminders(key, item, date, generation, now))
+            heapq.heapify(self._heap)
+        self._wakeup.set()
+
+    def update(self, key, item, date):
+        # Track a new date for `key`, or stop tracking it if `date` is None
+        now = self.clock.now()
+        with self._lock:
+            current = self._dates.get(key)
+            if date is None:
+                self._dates.pop(key, None)
+            elif current is None or current[:2] != (item, date):
+                generation = next(self._generations)
+                self._dates[key] = (item, date, generation)
+                for reminder in self._reminders(key, item, date, generation, now):
+                    heapq.heappush(self._heap, reminder)
+        self._wakeup.set()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def _is_current(self, reminder):
+        _, generation, key, _ = reminder
+        current = self._dates.get(key)
+        return current is not None and current[2] == generation
+
+    def next_due(self):
+        # When the next live reminder is due, or None if there are none
+        with self._lock:
+            while self._heap and not self._is_current(self._heap[0]):
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    def run_pending(self):
+        # Post every live reminder that is due; returns how many were posted
+        now = self.clock.now()
+        texts = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                reminder = heapq.heappop(self._heap)
+                if self._is_current(reminder):
+                    (kind, _), days = reminder[2], reminder[3]
+                    item, date, _ = self._dates[reminder[2]]
+                    texts.append(format_reminder(kind, item, date, days))
+        for text in texts:
+            try:
+                self.post(text)
+                self.posted += 1
+            except Exception:
+                logger.exception('Failed to post reminder %r', text)
+        return len(texts)
+
+    def run(self, until=None):
+        # Post reminders as they come due, forever or until the clock reaches
+        # `until`
+        while until is None or self.clock.now() < until:
+            self.run_pending()
+            now = self.clock.now()
+            next_due = self.next_due()
+            timeout = MAX_SLEEP if until is None else (until - now).total_seconds()
+            if next_due is not None:
+                timeout = min(timeout, max(0, (next_due - now).total_seconds()))
+            if self.clock.wait(self._wakeup, timeout):
+                self._wakeup.clear()
+
+
+def load_dates(session, today):
+    # (key, item, date) for every date on or after `today`
+    dates = []
+    deadlines = session.query(Deadline.id, Deadline.item, Deadline.date, Deadline.abstract_date).filter(
+        or_(Deadline.date >= today, Deadline.abstract_date >= today))
+    for row_id, item, date, abstract_date in deadlines:
+        if date >= today:
+            dates.append(((DEADLINE, row_id), item, date))
+        if abstract_date is not None and abstract_date >= today:
+            dates.append(((ABSTRACT, row_id), item, abstract_date))
+    responses = session.query(ResponseDeadline.id, ResponseDeadline.item,
+                              ResponseDeadline.early_response_date,
+                              ResponseDeadline.notification_date).filter(
+        or_(ResponseDeadline.early_response_date >= today,
+            ResponseDeadline.notification_date >= today))
+    for row_id, item, early_response_date, notification_date in responses:
+        if early_response_date is not None and early_response_date >= today:
+            dates.append(((EARLY, row_id), item, early_response_date))
+        if notification_date is not None and notification_date >= today:
+            dates.append(((FINAL, row_id), item, notification_date))
+    return dates
+
+
+_scheduler = None
+_thread = None
+
+
+def start(post, clock=None):
+    # Load the upcoming dates and start the thread posting reminders with
+    # `post`
+    global _scheduler, _thread
+    if _thread is not None:
+        return _scheduler
+    scheduler = ReminderScheduler(post, clock)
+    session = db.Session()
+    try:
+        scheduler.load(load_dates(session, scheduler.clock.now().date()))
+    finally:
+        session.close()
+    _scheduler = scheduler
+    _thread = threading.Thread(target=scheduler.run, name='reminders')
+    _thread.daemon = True
+    _thread.start()
+    return scheduler
+
+
+# Called by the command handlers after committing a change; they do nothing
+# unless reminders were started
+
+def deadline_changed(deadline):
+    if _scheduler is not None:
+        _scheduler.update((DEADLINE, deadline.id), deadline.item, deadline.date)
+        _scheduler.update((ABSTRACT, deadline.id), deadline.item, deadline.abstract_date)
+
+
+def response_changed(response):
+    if _scheduler is not None:
+        _scheduler.update((EARLY, response.id), response.item, response.early_response_date)
+        _scheduler.update((FINAL, response.id), response.item, response.notification_date)
+
+
+def deadline_removed(deadline_id, response_id=None):
+    if _scheduler is not None:
+        for key in ((DEADLINE, deadline_id), (ABSTRACT, deadline_id),
+                    (EARLY, response_id), (FINAL, response_id)):
+            _scheduler.update(key, None, None)
@@ -0,0 +1,68 @@
+# coding=utf-8
+from bisect import insort
+
+# Punctuation ignored at the end of a word when matching keywords, so that
+# "deadlines?" and "back?" match "deadlines" and "back"
+TRAILING_PUNCTUATION = '?!.,:;'
+
+
+class Tokens(object):
+    # A message split into words once. `words` are lower-cased and stripped
+    # of trailing punctuation for matching keywords; `raw` keeps the words as
+    # typed for items and dates.
+    __slots__ = ('raw', 'words')
+
+    def __init__(self, text):
+        self.raw = text.split()
+        self.words = [word.lower().rstrip(TRAILING_PUNCTUATION) for word in self.raw]
+
+    def __len__(self):
+        return len(self.words)
+
+    def text(self, start, stop=None):
+        return ' '.join(self.raw[start:stop])
+
+    def startswith(self, words, start=0):
+        return self.words[start:start + len(words)] == list(words)
+
+    def index(self, candidates, start=0, stop=None):
+        # First position in [start, stop) holding one of `candidates`, or -1
+        stop = len(self.words) if stop is None else stop
+        for i in range(start, stop):
+            if self.words[i] in candidates:
+                return i
+        return -1
+
+    def rindex(self, candidates, start=0, stop=None):
+        # Last position in [start, stop) holding one of `candidates`, or -1
+        stop = len(self.words) if stop is None else stop
+        for i in range(stop - 1, start - 1, -1):
+            if self.words[i] in candidates:
+                return i
+        return -1
+
+
+class Router(object):
+    # Dispatches a message to the first command, in order of precedence,
+    # whose parser accepts it. A parser takes the message's Tokens and returns
+    # the handler's arguments (after the message), or None if the message
+    # isn't that command. Parsers only ever scan the words a constant number
+    # of times, so dispatch is linear in the length of the message.
+    def __init__(self):
+        self._routes = []
+
+    def command(self, parse, precedence):
+        def wrapper(handler):
+            insort(self._routes, (precedence, len(self._routes), parse, handler))
+            return handler
+        return wrapper
+
+    def match(self, text):
+        # The handler and arguments the message would be dispatched to, or
+        # (None, None)
+        tokens = Tokens(text)
+        for _, _, parse, handler in self._routes:
+            args = parse(tokens)
+            if args is not None:
+                return handler, args
+        return None, None
@@ -1,3 +1,22 @@
 export DATABASE_URL=<SQLALCHEMY DATABASE URL>
 export SLACK_TOKEN=<SLACK USER TOKEN>
+# Optional settings
+# export ITEM_INDEX=0  # look up items with a database query instead of the in-process index
+# export LISTING_HORIZON_DAYS=365  # only list dates within this many days
+# export LISTING_LIMIT=100  # list at most this many rows from each table
+# export ARCHIVE_AFTER_DAYS=90  # keep past deadlines in the live tables this long before archiving them
+# export WORKER_THREADS=4  # threads running commands
+# export WORKER_QUEUE_LIMIT=50  # commands allowed to wait for a thread before the bot says it's busy
+# export LATEX_CACHE_DIR=/var/cache/performbot/latex  # where rendered formulas are kept
+# export LATEX_CACHE_MB=50  # size of the formula cache
+# export REMINDER_CHANNEL=deadlines  # post reminders 7, 1 and 0 days before each date to this channel
+# export REMINDER_TIME=09:00  # local time of day the reminders go out
+# export ICS_FEED_PORT=8080  # serve the upcoming dates as a calendar feed at /deadlines.ics
+# export DB_POOL_SIZE=5  # database connections kept open
+# export DB_POOL_OVERFLOW=5  # extra connections opened under load
+# export DB_POOL_RECYCLE=1800  # seconds before a connection is replaced
+# export SQL_ECHO=1  # log every SQL statement
+# export METRICS_FILE=/var/lib/node_exporter/performbot.prom  # write metrics in Prometheus text format
+# export METRICS_INTERVAL=60  # seconds between writes of METRICS_FILE
+# export WARM_UP=0  # don't preload slow imports and the database connection after connecting
 python mybot.py
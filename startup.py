@@ -0,0 +1,105 @@
+# coding=utf-8
+import importlib
+import logging
+import sys
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# The clock starts when this module is first imported, which mybot.py does
+# before anything else
+STARTED = time.time()
+
+logger = logging.getLogger(__name__)
+# The bot doesn't configure logging, so make sure the report is printed
+logger.setLevel(logging.INFO)
+logger.addHandler(logging.StreamHandler(sys.stderr))
+logger.propagate = False
+
+# Step name -> seconds taken, in the order the steps finished
+_timings = OrderedDict()
+_timings_lock = threading.Lock()
+
+
+def record(name, seconds):
+    with _timings_lock:
+        _timings[name] = seconds
+
+
+@contextmanager
+def timed(name):
+    start = time.time()
+    try:
+        yield
+    finally:
+        record(name, time.time() - start)
+
+
+def mark(name):
+    # Record the time from process start to now under `name`
+    record(name, time.time() - STARTED)
+
+
+def timings():
+    with _timings_lock:
+        return list(_timings.items())
+
+
+def report():
+    lines = ['Startup timings:']
+    for name, seconds in timings():
+        lines.append('  {:<40} {:8.3f}s'.format(name, seconds))
+    logger.info('\n'.join(lines))
+
+
+class LazyModule(object):
+    # Stands in for a module until one of its attributes is used, at which
+    # point the module is imported (and the import timed). `names` are tried
+    # in order, for modules with a fallback name.
+    def __init__(self, *names):
+        self._names = names
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        module = self._module
+        if module is not None:
+            return module
+        with self._lock:
+            if self._module is None:
+                error = None
+                for name in self._names:
+                    try:
+                        with timed('import ' + name):
+                            self._module = importlib.import_module(name)
+                        break
+                    except ImportError as e:
+                        error = e
+                else:
+                    raise error
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+
+def lazy_import(*names):
+    return LazyModule(*names)
+
+
+def warm_up(tasks):
+    # Run the (name, callable) pairs on a background thread, timing each, so
+    # the first command doesn't pay for imports and connections
+    def run():
+        for name, task in tasks:
+            try:
+                with timed('warm up ' + name):
+                    task()
+            except:
+                logger.exception('Warm-up step %s failed', name)
+        report()
+    thread = threading.Thread(target=run, name='warm-up')
+    thread.daemon = True
+    thread.start()
+    return thread
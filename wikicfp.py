@@ -0,0 +1,56 @@
+# coding=utf-8
+# Fetching and parsing WikiCFP pages. The listings never come here: they
+# take their links from the local index (see wikicfp_index), which calls
+# search() in the background.
+import threading
+
+import metrics
+import startup
+import wikicfp_parser
+
+# Only needed when the index is refreshed, so keep it off the startup path
+requests = startup.lazy_import('requests')
+
+WIKICFP_URL = "http://wikicfp.com"
+
+# Seconds to wait on any single WikiCFP request
+REQUEST_TIMEOUT = 5
+# Characters of a page handed to the parser at a time
+CHUNK_SIZE = 16384
+
+_http_session = None
+_http_session_lock = threading.Lock()
+
+
+def get_http_session():
+    # One keep-alive session for all WikiCFP traffic
+    global _http_session
+    with _http_session_lock:
+        if _http_session is None:
+            _http_session = requests.Session()
+    return _http_session
+
+
+def _parse_page(url, parse, params=None):
+    # Stream the page at `url` into `parse`, which stops reading once it has
+    # what it needs; the rest is read unparsed so the connection can be reused
+    resp = get_http_session().get(url, params=params, timeout=REQUEST_TIMEOUT, stream=True)
+    try:
+        resp.raise_for_status()
+        if resp.encoding is None:
+            resp.encoding = 'utf-8'
+        chunks = resp.iter_content(CHUNK_SIZE, decode_unicode=True)
+        result = parse(chunks)
+        for _ in chunks:
+            pass
+        return result
+    finally:
+        resp.close()
+
+
+def search(query):
+    # The WikiCFP search results for `query` across all years
+    with metrics.timed('wikicfp_fetch_seconds', page='search'):
+        return _parse_page(WIKICFP_URL + "/cfp/servlet/tool.search",
+                           wikicfp_parser.parse_search_results,
+                           params={'q': query, 'year': 'a'})
@@ -0,0 +1,177 @@
+# coding=utf-8
+# Local index of the WikiCFP events for the conferences the bot tracks. The
+# listings link conference names to WikiCFP from the index alone; refresh()
+# keeps it up to date in the background, searching WikiCFP once per series
+# (e.g. "CHI") for all its years, and only when a tracked year is missing.
+import datetime
+import logging
+import re
+from collections import defaultdict
+
+import db
+import metrics
+import wikicfp
+from db import WikiCFPEvent, WikiCFPSeries
+
+logger = logging.getLogger(__name__)
+
+# How long to wait before searching again for a series whose tracked year
+# wasn't on WikiCFP yet
+SEARCH_RETRY = datetime.timedelta(days=2)
+
+# A year at the end of a normalized name: "chi 2027", "chi2027" or "chi'27"
+_YEAR_RE = re.compile(r"^(.*?)\s*(?:((?:19|20)\d\d)|'(\d\d))$")
+# WikiCFP's date format, as in "Sep 12, 2026"; a deadline can be followed by
+# the abstract deadline in parentheses
+_DEADLINE_RE = re.compile(r'[A-Z][a-z]{2} \d{1,2}, \d{4}')
+
+
+def split_name(name):
+    # (series key, year) of a conference name; the year is None if the name
+    # doesn't end in one
+    key = db.normalize_item(name)
+    match = _YEAR_RE.match(key)
+    if not match or not match.group(1):
+        return key, None
+    if match.group(2):
+        return match.group(1), int(match.group(2))
+    return match.group(1), 2000 + int(match.group(3))
+
+
+def parse_deadline(text):
+    match = _DEADLINE_RE.search(text or '')
+    if not match:
+        return None
+    try:
+        return datetime.datetime.strptime(match.group(0), '%b %d, %Y').date()
+    except ValueError:
+        return None
+
+
+def _candidate_years(year, date):
+    # Years of a series' events that can stand for a tracked conference: its
+    # own year if the name has one, otherwise the year of its date or the
+    # year after (a September deadline is usually for next year's meeting)
+    if year is not None:
+        return (year,)
+    return (date.year - 1, date.year, date.year + 1)
+
+
+def _tracked(session, today):
+    # (name, date) of every conference the listings can show
+    tracked = [(d.item, d.date) for d in db.upcoming_deadlines(session, today)]
+    tracked.extend((r.item, r.notification_date or r.early_response_date)
+                   for r in db.upcoming_responses(session, today))
+    return tracked
+
+
+def _store(series_key, results, now):
+    # Add the results that belong to the series to the index; returns how
+    # many there were
+    session = db.Session()
+    try:
+        stored = 0
+        for result in results:
+            result_series, year = split_name(result.name)
+            if result_series != series_key:
+                continue
+            session.merge(WikiCFPEvent(
+                link=result.link, name=result.name, lookup_key=db.normalize_item(result.name),
+                series_key=result_series, year=year, title=result.title, dates=result.dates,
+                location=result.location, deadline=result.deadline,
+                deadline_date=parse_deadline(result.deadline), fetched_at=now))
+            stored += 1
+        session.merge(WikiCFPSeries(series_key=series_key, fetched_at=now))
+        session.commit()
+        return stored
+    except:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+
+
+@db.retry_read
+def series_to_search(session, today, now):
+    # Series keys with a tracked conference whose year has no event in the
+    # index, leaving out those searched within SEARCH_RETRY
+    wanted = defaultdict(list)
+    for name, date in _tracked(session, today):
+        series_key, year = split_name(name)
+        wanted[series_key].append(_candidate_years(year, date))
+    if not wanted:
+        return []
+    indexed = defaultdict(set)
+    for series_key, year in session.query(WikiCFPEvent.series_key, WikiCFPEvent.year).filter(
+            WikiCFPEvent.series_key.in_(wanted)).distinct():
+        indexed[series_key].add(year)
+    searched = dict(session.query(WikiCFPSeries.series_key, WikiCFPSeries.fetched_at).filter(
+        WikiCFPSeries.series_key.in_(wanted)))
+    stale = []
+    for series_key, candidates in sorted(wanted.items()):
+        years = indexed[series_key]
+        # Events without a year in their name stand for any year
+        if None in years or all(years.intersection(c) for c in candidates):
+            continue
+        if series_key in searched and searched[series_key] + SEARCH_RETRY > now:
+            continue
+        stale.append(series_key)
+    return stale
+
+
+def refresh(today=None):
+    # Search WikiCFP for every series that series_to_search() picks out, one
+    # at a time, and store what it finds. Bumps the data version if anything
+    # was added so the listings pick up the links. Returns the number of
+    # series searched.
+    today = today or datetime.date.today()
+    now = datetime.datetime.utcnow()
+    session = db.Session()
+    try:
+        stale = series_to_search(session, today, now)
+    finally:
+        session.close()
+    added = 0
+    for series_key in stale:
+        try:
+            added += _store(series_key, wikicfp.search(series_key), now)
+        except Exception:
+            logger.exception('Failed to index WikiCFP series %s', series_key)
+    if added:
+        db.bump_data_version()
+    return len(stale)
+
+
+def lookup_urls(session, items):
+    # Map conference names to WikiCFP event pages from the index, for (name,
+    # date) pairs. A name with a year matches that year's event; otherwise
+    # the event in the series whose published deadline is closest to the date
+    # is picked. Names without an indexed event are left out. `items` may be
+    # a generator: it is read once, before any retry.
+    return _lookup_urls(session, [(name, split_name(name), date) for name, date in items])
+
+
+@db.retry_read
+def _lookup_urls(session, wanted):
+    series_keys = set(series_key for _, (series_key, _), _ in wanted)
+    if not series_keys:
+        return dict()
+    events = defaultdict(list)
+    for event in session.query(WikiCFPEvent).filter(WikiCFPEvent.series_key.in_(series_keys)):
+        events[event.series_key].append(event)
+    urls = dict()
+    for name, (series_key, year), date in wanted:
+        years = _candidate_years(year, date) if date is not None else (year,)
+        candidates = [e for e in events[series_key]
+                      if e.year in years or e.year is None or (year is None and date is None)]
+        if not candidates:
+            metrics.inc('wikicfp_index_lookups_total', result='miss')
+            continue
+        metrics.inc('wikicfp_index_lookups_total', result='hit')
+
+        def distance(event):
+            if event.deadline_date is None or date is None:
+                return (1, 0, event.link)
+            return (0, abs((event.deadline_date - date).days), event.link)
+        urls[name] = wikicfp.WIKICFP_URL + min(candidates, key=distance).link
+    return urls
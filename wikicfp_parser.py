@@ -0,0 +1,146 @@
+# coding=utf-8
+# Extracts what the bot needs from WikiCFP pages with the standard library's
+# streaming HTML tokenizer, without building a document tree. Pages are fed
+# in chunks as they arrive and parsing stops once the part of the page that
+# matters has been read.
+from collections import namedtuple
+from html.parser import HTMLParser
+
+# One conference in the search results. `name` is the short name the results
+# link (e.g. "CHI 2027"), `title` the full name, and `link` the event page's
+# path on WikiCFP.
+SearchResult = namedtuple('SearchResult', ['name', 'title', 'dates', 'location', 'deadline', 'link'])
+
+RESULTS_HEADER = ['Event', 'When', 'Where', 'Deadline']
+
+def _clean(parts):
+    return ' '.join(''.join(parts).split())
+
+
+def _has_class(attrs, name):
+    return name in (dict(attrs).get('class') or '').split()
+
+
+class _ContentParser(HTMLParser):
+    # Tracks whether the tokenizer is inside the page's <div class="contsec">,
+    # which holds everything below the site header and menus
+    def __init__(self):
+        HTMLParser.__init__(self, convert_charrefs=True)
+        self.done = False
+        self._div_depth = 0
+
+    def handle_starttag(self, tag, attrs):
+        if self.done:
+            return
+        if tag == 'div':
+            if self._div_depth:
+                self._div_depth += 1
+            elif _has_class(attrs, 'contsec'):
+                self._div_depth = 1
+                return
+        if self._div_depth:
+            self.content_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if self.done or not self._div_depth:
+            return
+        if tag == 'div':
+            self._div_depth -= 1
+            if not self._div_depth:
+                self.done = True
+                return
+        self.content_endtag(tag)
+
+    def handle_data(self, data):
+        if not self.done and self._div_depth:
+            self.content_data(data)
+
+    def content_starttag(self, tag, attrs):
+        pass
+
+    def content_endtag(self, tag):
+        pass
+
+    def content_data(self, data):
+        pass
+
+
+class _SearchPageParser(_ContentParser):
+    # The results table starts with an Event/When/Where/Deadline header row,
+    # followed by two rows per conference: the linked short name and the
+    # full name, then the dates, location and submission deadline
+    def __init__(self):
+        _ContentParser.__init__(self)
+        self.results = []
+        self.found_header = False
+        self._table_depth = 0
+        self._results_depth = None
+        # Cells of the rows being read, innermost last; a cell is
+        # [text parts, first link]
+        self._rows = []
+        self._cell = None
+        self._first_row = None
+
+    def content_starttag(self, tag, attrs):
+        if tag == 'table':
+            self._table_depth += 1
+        elif tag == 'tr':
+            self._rows.append([])
+        elif tag == 'td' and self._rows:
+            self._cell = [[], None]
+            self._rows[-1].append(self._cell)
+        elif tag == 'a' and self._cell is not None and self._cell[1] is None:
+            self._cell[1] = dict(attrs).get('href')
+
+    def content_endtag(self, tag):
+        if tag == 'table':
+            if self._table_depth == self._results_depth:
+                self.done = True
+            self._table_depth -= 1
+        elif tag == 'td':
+            self._cell = None
+        elif tag == 'tr' and self._rows:
+            self._end_row(self._rows.pop())
+
+    def content_data(self, data):
+        if self._cell is not None:
+            self._cell[0].append(data)
+
+    def _end_row(self, cells):
+        texts = [_clean(parts) for parts, _ in cells]
+        if not self.found_header:
+            if texts == RESULTS_HEADER:
+                self.found_header = True
+                self._results_depth = self._table_depth
+            return
+        if len(cells) == 2 and cells[0][1]:
+            self._first_row = (texts[0], texts[1], cells[0][1])
+        elif len(cells) == 3 and self._first_row is not None:
+            name, title, link = self._first_row
+            self.results.append(SearchResult(name, title, texts[0], texts[1], texts[2], link))
+            self._first_row = None
+        else:
+            self._first_row = None
+
+
+def _feed(parser, chunks):
+    # `chunks` is an iterable of text; only as much of it is consumed as the
+    # parser needs
+    if isinstance(chunks, str):
+        chunks = [chunks]
+    for chunk in chunks:
+        parser.feed(chunk)
+        if parser.done:
+            break
+    return parser
+
+
+def parse_search_results(chunks):
+    # The SearchResults on a WikiCFP search page, in page order. Raises
+    # ValueError if the page has no results table, which means it isn't a
+    # search page or WikiCFP changed its layout.
+    parser = _feed(_SearchPageParser(), chunks)
+    if not parser.found_header:
+        raise ValueError("Not a WikiCFP search results page")
+    return parser.results
+
@@ -0,0 +1,148 @@
+# coding=utf-8
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+
+import db
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Threads running command handlers, and how many commands may wait for one
+# before new commands are turned away
+THREADS = int(os.environ.get('WORKER_THREADS', '4'))
+QUEUE_LIMIT = int(os.environ.get('WORKER_QUEUE_LIMIT', '50'))
+# Number of recent waits kept for the wait-time percentiles
+RECENT_WAITS = 1000
+# A command that waited longer than this many seconds to start is logged,
+# along with the pool's stats, as a sign the pool is too small
+SLOW_WAIT = 5
+
+
+class ChannelWorkers(object):
+    # Runs command handlers on a fixed pool of threads instead of slackbot's
+    # dispatcher threads. Commands from the same channel run one at a time in
+    # the order they arrived, so "X moved to ..." followed by "deadlines"
+    # lists the new date; commands from different channels run in parallel.
+    # Once `queue_limit` commands are waiting, submit() refuses new ones.
+    def __init__(self, threads=THREADS, queue_limit=QUEUE_LIMIT):
+        self.threads = threads
+        self.queue_limit = queue_limit
+        self._executor = ThreadPoolExecutor(max_workers=threads)
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        # channel -> commands waiting behind the one started in that channel
+        self._channels = dict()
+        # Commands accepted but not yet running, whether behind their channel
+        # or waiting for a free thread
+        self._queued = 0
+        self._running = 0
+        self._peak_queued = 0
+        self._completed = 0
+        self._shed = 0
+        self._waits = deque(maxlen=RECENT_WAITS)
+
+    def submit(self, channel, func, *args):
+        # Queue func(*args) behind the channel's earlier commands; returns
+        # False, without queueing it, if too many commands are waiting
+        task = (time.time(), func, args)
+        with self._lock:
+            if self._queued >= self.queue_limit:
+                self._shed += 1
+                shed = self._shed
+                accepted = False
+            else:
+                accepted = True
+                self._queued += 1
+                self._peak_queued = max(self._peak_queued, self._queued)
+                pending = self._channels.get(channel)
+                if pending is None:
+                    # Nothing running in this channel
+                    self._channels[channel] = deque()
+                    self._start(channel, task)
+                else:
+                    pending.append(task)
+        if not accepted:
+            metrics.inc('commands_shed_total')
+            logger.warning('Turned away a command in %s; %d commands shed so far', channel, shed)
+        return accepted
+
+    def _start(self, channel, task):
+        # With the lock held. The command still counts as queued until a
+        # thread picks it up, since the executor queues it until then.
+        self._executor.submit(self._run, channel, task)
+
+    def _run(self, channel, task):
+        submitted, func, args = task
+        wait = time.time() - submitted
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+            self._waits.append(wait)
+        metrics.observe('worker_wait_seconds', wait)
+        if wait > SLOW_WAIT:
+            logger.warning('%s waited %.1fs to start: %s', getattr(func, '__name__', func),
+                           wait, self.stats())
+        try:
+            with metrics.command(getattr(func, '__name__', str(func))):
+                func(*args)
+        except Exception:
+            logger.exception('Failed to run %s', getattr(func, '__name__', func))
+        finally:
+            db.remove_session()
+            with self._lock:
+                self._running -= 1
+                self._completed += 1
+                pending = self._channels[channel]
+                if pending:
+                    self._start(channel, pending.popleft())
+                else:
+                    del self._channels[channel]
+                if not self._channels:
+                    self._idle.notify_all()
+
+    def wait_idle(self, timeout=None):
+        # Block until every submitted command has finished; returns False if
+        # `timeout` seconds pass first
+        with self._lock:
+            return self._idle.wait_for(lambda: not self._channels, timeout)
+
+    def stats(self):
+        with self._lock:
+            waits = sorted(self._waits)
+            stats = {
+                'threads': self.threads,
+                'queue_limit': self.queue_limit,
+                'queued': self._queued,
+                'peak_queued': self._peak_queued,
+                'running': self._running,
+                'completed': self._completed,
+                'shed': self._shed,
+            }
+        for pct in (50, 95, 99):
+            stats['wait_p{}'.format(pct)] = waits[min(len(waits) - 1, len(waits) * pct // 100)] if waits else 0.0
+        stats['wait_max'] = waits[-1] if waits else 0.0
+        return stats
+
+
+pool = ChannelWorkers()
+
+
+def run(message, func, *args):
+    # Run func(message, *args) on the pool in the order of the message's
+    # channel, telling the user if the bot is too busy to take it
+    if not pool.submit(message.body.get('channel'), func, message, *args):
+        message.reply("I'm busy with other requests right now, try again in a moment.")
+
+
+def queued(func):
+    # Decorator for a plugin handler that should run on the pool rather than
+    # on the slackbot dispatcher thread that received the message
+    @wraps(func)
+    def wrapper(message, *args):
+        run(message, func, *args)
+    return wrapper